@@ -0,0 +1 @@
+"""Offline throughput/latency benchmarks; see benchmarks/run.py."""
@@ -0,0 +1,60 @@
+"""Synthetic comment corpora with a configurable size and length distribution."""
+
+from __future__ import annotations
+
+import math
+import random
+
+import pandas as pd
+
+WORDS = (
+    "the a you this that is are was not really just like think people "
+    "thanks for sharing great post idiot stupid awful love hate agree "
+    "disagree article source wrong right lol ok please stop why what"
+).split()
+# Snippets that exercise the HTML/URL path of the cleaner
+MARKUP = [
+    "<b>{}</b>",
+    "{} &amp; more",
+    "see https://example.com/{}?ref=x",
+    "check www.site{}.com",
+    "HTTP://CAPS.EXAMPLE.COM/{}",
+]
+# Whitespace/punctuation noise the cleaner normalizes
+NOISE = ["  ", "\t", "\n\n", " ,", " !", " ?", "!!!", " ..."]
+
+
+def make_corpus(
+    rows: int,
+    mean_words: float = 30.0,
+    sigma: float = 1.0,
+    max_words: int = 600,
+    markup_share: float = 0.2,
+    dup_share: float = 0.0,
+    seed: int = 0,
+) -> pd.Series:
+    """
+    `rows` comments whose word counts follow a log-normal distribution with
+    mean ~`mean_words` (`sigma` controls the tail), capped at `max_words`.
+    `markup_share` of them contain HTML/URLs; `dup_share` are exact repeats
+    of earlier rows.
+    """
+    rng = random.Random(seed)  # noqa: S311 - synthetic data only
+    mu = max(mean_words, 1.0)
+    # mean of lognormal = exp(m + s^2 / 2)
+    m = math.log(mu) - sigma**2 / 2
+    out: list[str] = []
+    for i in range(rows):
+        if out and rng.random() < dup_share:
+            out.append(out[rng.randrange(len(out))])
+            continue
+        n = min(max(int(rng.lognormvariate(m, sigma)), 1), max_words)
+        words = [rng.choice(WORDS) for _ in range(n)]
+        if rng.random() < 0.3:
+            words[0] = words[0].upper()
+        if rng.random() < 0.5:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(NOISE))
+        if rng.random() < markup_share:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(MARKUP).format(i))
+        out.append(" ".join(words))
+    return pd.Series(out, dtype=object)
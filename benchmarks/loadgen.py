@@ -0,0 +1,199 @@
+"""
+Drive POST /moderate with a replayed or synthetic request stream.
+
+    # replay a JSONL log in-process (stub model, no network)
+    PYTHONPATH=src python -m benchmarks.loadgen --input requests.jsonl --field text --concurrency 32
+
+    # synthetic stream with 40% repeats, open loop at 200 req/s against a server
+    python -m benchmarks.loadgen --synthetic 5000 --dup-ratio 0.4 --rate 200 \
+        --url http://localhost:8000
+
+With --rate requests are sent on a fixed schedule whatever the server does
+(open loop) and latency is measured from the scheduled send time, so queueing
+delay is not hidden. Otherwise --concurrency clients send back to back
+(closed loop). Reports throughput, latency percentiles, errors and the cache
+hit ratio seen in responses.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import tempfile
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+
+from .corpus import make_corpus
+from .stub_model import StubModel
+
+
+@dataclass
+class LoadReport:
+    sent: int = 0
+    ok: int = 0
+    cached: int = 0
+    errors: Counter = field(default_factory=Counter)
+    latencies_ms: list[float] = field(default_factory=list)
+    elapsed_s: float = 0.0
+
+    def record(self, latency_ms: float, cached: bool, error: str | None):
+        self.sent += 1
+        self.latencies_ms.append(latency_ms)
+        if error is None:
+            self.ok += 1
+            self.cached += cached
+        else:
+            self.errors[error] += 1
+
+    def summary(self) -> dict:
+        lat = np.asarray(self.latencies_ms or [0.0])
+        return {
+            "sent": self.sent,
+            "ok": self.ok,
+            "error_rate": round(1 - self.ok / self.sent, 4) if self.sent else 0.0,
+            "errors": dict(self.errors),
+            "throughput_rps": round(self.sent / self.elapsed_s, 1) if self.elapsed_s else 0.0,
+            "cache_hit_ratio": round(self.cached / self.ok, 3) if self.ok else 0.0,
+            "latency_ms": {
+                "p50": round(float(np.percentile(lat, 50)), 2),
+                "p90": round(float(np.percentile(lat, 90)), 2),
+                "p99": round(float(np.percentile(lat, 99)), 2),
+                "max": round(float(lat.max()), 2),
+            },
+        }
+
+
+def load_texts(path: Path, text_field: str = "text") -> list[str]:
+    """Texts from a JSONL log; lines without `text_field` are skipped."""
+    texts = []
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            if not line.strip():
+                continue
+            value = json.loads(line).get(text_field)
+            if isinstance(value, str) and value.strip():
+                texts.append(value)
+    return texts
+
+
+async def _send(client, text: str, started: float, report: LoadReport) -> None:
+    cached, error = False, None
+    try:
+        r = await client.post("/moderate", json={"text": text})
+        if r.status_code == 200:
+            cached = bool(r.json().get("cached"))
+        else:
+            error = f"HTTP {r.status_code}"
+    except Exception as exc:  # connection resets, timeouts, ...
+        error = type(exc).__name__
+    report.record((time.perf_counter() - started) * 1000.0, cached, error)
+
+
+async def run_load(
+    client,
+    texts: list[str],
+    concurrency: int = 16,
+    rate: float | None = None,
+) -> LoadReport:
+    """Send every text once, closed loop with `concurrency` or open loop at `rate`/s."""
+    report = LoadReport()
+    t0 = time.perf_counter()
+    if rate:
+        tasks = []
+        for i, text in enumerate(texts):
+            scheduled = t0 + i / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(_send(client, text, scheduled, report)))
+        await asyncio.gather(*tasks)
+    else:
+        it = iter(texts)
+
+        async def worker():
+            for text in it:
+                await _send(client, text, time.perf_counter(), report)
+
+        await asyncio.gather(*(worker() for _ in range(max(concurrency, 1))))
+    report.elapsed_s = time.perf_counter() - t0
+    return report
+
+
+async def _main_async(args, texts: list[str]) -> LoadReport:
+    import httpx
+
+    limits = httpx.Limits(max_connections=max(args.concurrency, 100))
+    if args.url:
+        async with httpx.AsyncClient(
+            base_url=args.url, timeout=args.timeout, limits=limits
+        ) as client:
+            return await run_load(client, texts, args.concurrency, args.rate)
+
+    # In-process: the real app over an ASGI transport, starting from an empty
+    # cache, with the stub model unless --real-model is given
+    from moderation import cache, pipeline
+    from service.app import app
+
+    logging.getLogger().setLevel(logging.WARNING)
+    saved = cache.DB_PATH, pipeline._toxicity_model
+    if not args.real_model:
+        pipeline._toxicity_model = StubModel(args.us_per_token)
+    transport = httpx.ASGITransport(app=app)
+    with tempfile.TemporaryDirectory() as tmp:
+        cache.DB_PATH = Path(tmp) / "loadgen.db"
+        try:
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://loadgen", timeout=args.timeout
+            ) as client:
+                report = await run_load(client, texts, args.concurrency, args.rate)
+            cache.flush()
+        finally:
+            cache.DB_PATH, pipeline._toxicity_model = saved
+    return report
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    src = parser.add_mutually_exclusive_group(required=True)
+    src.add_argument("--input", type=Path, help="JSONL request log to replay")
+    src.add_argument("--synthetic", type=int, metavar="N", help="Generate N requests instead")
+    parser.add_argument("--field", default="text", help="JSON field holding the text")
+    parser.add_argument("--dup-ratio", type=float, default=0.3, help="Repeats in --synthetic")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--url", help="Target server (default: in-process ASGI app)")
+    parser.add_argument("--real-model", action="store_true", help="In-process: real model")
+    parser.add_argument("--us-per-token", type=float, default=0.5, help="Stub model cost")
+    parser.add_argument("--concurrency", type=int, default=16, help="Closed-loop clients")
+    parser.add_argument("--rate", type=float, help="Open-loop requests per second")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout (s)")
+    parser.add_argument("--out", type=Path, help="Write the report JSON here")
+    args = parser.parse_args(argv)
+
+    if args.input:
+        texts = load_texts(args.input, args.field)
+    else:
+        corpus = make_corpus(args.synthetic, dup_share=args.dup_ratio, seed=args.seed)
+        texts = [t for t in corpus.tolist() if t.strip()]
+    if not texts:
+        print("no requests to send", file=sys.stderr)
+        return 1
+
+    report = asyncio.run(_main_async(args, texts))
+    summary = report.summary()
+    print(json.dumps(summary, indent=2))
+    if args.out:
+        args.out.write_text(json.dumps(summary, indent=2) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,270 @@
+"""
+Offline benchmarks for the cleaning, scoring, cache and API hot paths.
+
+    PYTHONPATH=src python -m benchmarks.run --out bench.json --baseline benchmarks/baseline.json
+
+Every suite runs on a synthetic corpus (benchmarks/corpus.py) and the stub
+model (benchmarks/stub_model.py), so no network or GPU is needed. Results are
+a flat {metric: value} dict written as JSON; with --baseline each metric is
+compared against a stored run and regressions beyond --tolerance are flagged.
+Metrics ending in `_per_s` or `hit_ratio` are better when higher; everything
+else (latencies, padded tokens, mismatches) is better when lower.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+from .corpus import make_corpus
+from .stub_model import StubModel
+
+SUITES = ("clean", "score", "cache", "api")
+
+
+def _timed(fn: Callable[[], object], repeat: int = 3) -> tuple[float, object]:
+    """Best wall time over `repeat` runs, and the last result."""
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def _percentiles(prefix: str, latencies_ms: list[float]) -> dict:
+    arr = np.asarray(latencies_ms)
+    return {
+        f"{prefix}.p50_ms": round(float(np.percentile(arr, 50)), 3),
+        f"{prefix}.p90_ms": round(float(np.percentile(arr, 90)), 3),
+        f"{prefix}.p99_ms": round(float(np.percentile(arr, 99)), 3),
+        f"{prefix}.max_ms": round(float(arr.max()), 3),
+    }
+
+
+def bench_clean(args) -> dict:
+    from moderation.cleaning import basic_clean, clean_series
+
+    corpus = make_corpus(args.rows, args.mean_words, args.sigma, markup_share=args.markup_share)
+    t_row, expected = _timed(lambda: corpus.map(basic_clean))
+    t_col, got = _timed(lambda: clean_series(corpus))
+    return {
+        "clean.basic_clean.rows_per_s": round(len(corpus) / t_row),
+        "clean.clean_series.rows_per_s": round(len(corpus) / t_col),
+        "clean.mismatches": int((expected != got).sum()),
+    }
+
+
+def bench_score(args) -> dict:
+    from moderation import pipeline
+    from moderation.cleaning import clean_series
+
+    texts = clean_series(
+        make_corpus(
+            args.rows,
+            args.mean_words,
+            args.sigma,
+            markup_share=args.markup_share,
+            dup_share=args.dup_share,
+        )
+    ).tolist()
+    model = StubModel(args.us_per_token)
+    saved, pipeline._toxicity_model = pipeline._toxicity_model, model
+
+    out = {}
+    try:
+        for name, fn in (
+            ("score_multilabel", pipeline.score_multilabel),
+            ("score_multilabel_dedup", pipeline.score_multilabel_dedup),
+        ):
+            model.padded_tokens = 0
+            t, _ = _timed(lambda fn=fn: fn(texts), repeat=1)
+            out[f"score.{name}.rows_per_s"] = round(len(texts) / t)
+            out[f"score.{name}.padded_tokens"] = model.padded_tokens
+    finally:
+        pipeline._toxicity_model = saved
+    return out
+
+
+def bench_cache(args) -> dict:
+    from moderation.cache import MemoryCache, SQLiteCache, TieredCache
+
+    n = args.cache_ops
+    labels = {"toxic": 0.1, "insult": 0.2}
+    keys = [f"{i:064x}" for i in range(n)]
+    out = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteCache(Path(tmp) / "bench.db")
+
+        def put():
+            store.put_many((k, 0.5, False, labels) for k in keys)
+            store.flush()
+
+        t, _ = _timed(put, repeat=1)
+        out["cache.put_many.ops_per_s"] = round(n / t)
+
+        t, _ = _timed(lambda: [store.get(k) for k in keys], repeat=1)
+        out["cache.sqlite_get.ops_per_s"] = round(n / t)
+
+        t, _ = _timed(
+            lambda: [store.get_many(keys[i : i + 100]) for i in range(0, n, 100)], repeat=1
+        )
+        out["cache.sqlite_get_many.ops_per_s"] = round(n / t)
+
+        tiered = TieredCache(store, MemoryCache(max_entries=n, max_bytes=1 << 30))
+        for k in keys:  # promote everything into the memory tier
+            tiered.get(k)
+        t, _ = _timed(lambda: [tiered.get(k) for k in keys])
+        out["cache.memory_get.ops_per_s"] = round(n / t)
+        store.close()
+    return out
+
+
+async def _api_run(app, texts: list[str], concurrency: int) -> tuple[list[float], int]:
+    import httpx
+
+    latencies: list[float] = []
+    hits = 0
+    queue: asyncio.Queue[str] = asyncio.Queue()
+    for t in texts:
+        queue.put_nowait(t)
+
+    async def worker(client):
+        nonlocal hits
+        while not queue.empty():
+            text = queue.get_nowait()
+            t0 = time.perf_counter()
+            r = await client.post("/moderate", json={"text": text})
+            latencies.append((time.perf_counter() - t0) * 1000.0)
+            r.raise_for_status()
+            hits += r.json()["cached"]
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    return latencies, hits
+
+
+def bench_api(args) -> dict:
+    from moderation import cache, pipeline
+
+    saved = cache.DB_PATH, pipeline._toxicity_model
+    with tempfile.TemporaryDirectory() as tmp:
+        cache.DB_PATH = Path(tmp) / "api.db"
+        pipeline._toxicity_model = StubModel(args.us_per_token)
+        from service.app import app
+
+        logging.getLogger().setLevel(logging.WARNING)
+        texts = make_corpus(
+            args.requests,
+            args.mean_words,
+            args.sigma,
+            markup_share=args.markup_share,
+            dup_share=args.dup_share,
+            seed=1,
+        ).tolist()
+        texts = [t for t in texts if t.strip()]
+
+        try:
+            t0 = time.perf_counter()
+            latencies, hits = asyncio.run(_api_run(app, texts, args.concurrency))
+            elapsed = time.perf_counter() - t0
+            cache.flush()
+        finally:
+            cache.DB_PATH, pipeline._toxicity_model = saved
+
+    return {
+        "api.requests_per_s": round(len(latencies) / elapsed),
+        **_percentiles("api", latencies),
+        "api.mean_ms": round(statistics.fmean(latencies), 3),
+        "api.cache_hit_ratio": round(hits / len(latencies), 3),
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list[tuple]:
+    """(metric, baseline, current, relative change, regressed) for shared metrics."""
+    rows = []
+    for name, now in current.items():
+        if name not in baseline or not isinstance(now, int | float):
+            continue
+        before = baseline[name]
+        change = (now - before) / before if before else (0.0 if now == before else float("inf"))
+        higher_is_better = name.endswith("_per_s") or name.endswith("hit_ratio")
+        worse = -change if higher_is_better else change
+        rows.append((name, before, now, change, worse > tolerance))
+    return rows
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--suite", nargs="+", choices=SUITES, default=list(SUITES))
+    parser.add_argument("--rows", type=int, default=20_000, help="Corpus size (clean/score)")
+    parser.add_argument("--mean-words", type=float, default=30.0)
+    parser.add_argument("--sigma", type=float, default=1.0, help="Log-normal length spread")
+    parser.add_argument("--markup-share", type=float, default=0.2)
+    parser.add_argument("--dup-share", type=float, default=0.3)
+    parser.add_argument("--us-per-token", type=float, default=0.5, help="Stub model cost")
+    parser.add_argument("--cache-ops", type=int, default=20_000)
+    parser.add_argument("--requests", type=int, default=2_000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--out", type=Path, help="Write results JSON here")
+    parser.add_argument("--baseline", type=Path, help="Results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative slowdown")
+    parser.add_argument(
+        "--fail-on-regression", action="store_true", help="Exit 1 if anything regressed"
+    )
+    args = parser.parse_args(argv)
+
+    runners = {"clean": bench_clean, "score": bench_score, "cache": bench_cache, "api": bench_api}
+    metrics: dict = {}
+    for suite in args.suite:
+        t0 = time.perf_counter()
+        metrics.update(runners[suite](args))
+        print(f"{suite}: done in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+
+    result = {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("out", "baseline")},
+        },
+        "metrics": metrics,
+    }
+    if args.out:
+        args.out.write_text(json.dumps(result, indent=2, sort_keys=True) + "\n")
+
+    if not args.baseline:
+        for name, value in metrics.items():
+            print(f"{name:45} {value:>14}")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text())["metrics"]
+    regressed = False
+    print(f"{'metric':45} {'baseline':>14} {'current':>14} {'change':>9}")
+    for name, before, now, change, bad in compare(metrics, baseline, args.tolerance):
+        regressed |= bad
+        flag = "  REGRESSED" if bad else ""
+        print(f"{name:45} {before:>14} {now:>14} {change:>+9.1%}{flag}")
+    if metrics.get("clean.mismatches"):
+        regressed = True
+        print("clean_series output differs from basic_clean")
+    return 1 if regressed and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
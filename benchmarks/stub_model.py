@@ -0,0 +1,56 @@
+"""Deterministic stand-in for toxic-bert so benchmarks run offline."""
+
+from __future__ import annotations
+
+import hashlib
+import time
+
+LABELS = ["toxic", "severe_toxic", "obscene", "threat", "insult", "identity_hate"]
+
+
+class StubTokenizer:
+    model_max_length = 512
+
+    def __call__(self, texts, truncation: bool = True, **_):
+        if isinstance(texts, str):
+            texts = [texts]
+        limit = self.model_max_length if truncation else None
+        return {"input_ids": [[0] * min(len(t.split()) + 2, limit or 1 << 30) for t in texts]}
+
+
+class StubModel:
+    """
+    HF text-classification pipeline contract (top_k=None) with scores derived
+    from a hash of the text. Each batch sleeps `us_per_token` microseconds per
+    padded token (batch x longest text), a rough model of transformer cost,
+    so padding and batching changes show up in the numbers.
+    """
+
+    def __init__(self, us_per_token: float = 0.5):
+        self.tokenizer = StubTokenizer()
+        self.us_per_token = us_per_token
+        self.calls = 0
+        self.padded_tokens = 0
+
+    def __call__(self, texts, truncation: bool = True, batch_size: int = 32, **_):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        lengths = [len(ids) for ids in self.tokenizer(texts, truncation=truncation)["input_ids"]]
+        out = []
+        bs = max(int(batch_size), 1)
+        for i in range(0, len(texts), bs):
+            batch = texts[i : i + bs]
+            padded = len(batch) * max(lengths[i : i + bs])
+            self.calls += 1
+            self.padded_tokens += padded
+            if self.us_per_token:
+                time.sleep(padded * self.us_per_token / 1e6)
+            for t in batch:
+                digest = hashlib.blake2b(t.encode("utf-8"), digest_size=len(LABELS)).digest()
+                out.append(
+                    [
+                        {"label": lab, "score": b / 255}
+                        for lab, b in zip(LABELS, digest, strict=True)
+                    ]
+                )
+        return out[0] if single else out
@@ -1,20 +1,26 @@
 from __future__ import annotations
 
 import logging
+import os
 from datetime import datetime, timedelta
 from pathlib import Path
 
 from airflow import DAG
 from airflow.operators.python import PythonOperator  # type: ignore
-from moderation.io import already_processed
-from moderation.pipeline import clean, ingest, score_multilabel, store
+from moderation.io import filter_unprocessed
+from moderation.pipeline import attach_scores, clean, ingest, store
 
 REPO_ROOT = Path(__file__).resolve().parents[1]
 INCOMING_DIR = REPO_ROOT / "data" / "incoming"
 PROCESSED_DIR = REPO_ROOT / "data" / "processed"
 SCORED_DIR = REPO_ROOT / "data" / "scored"
 QUARANTINE_DIR = REPO_ROOT / "data" / "quarantine"
-MAX_STATE_ENTRIES = 5000  # simple cap for .processed_index.json
+# Processed-file fingerprints older than this are forgotten
+STATE_RETENTION_DAYS = int(os.getenv("STREAM_STATE_RETENTION_DAYS", "30"))
+# Mapped process_file instances running at once. Needs a parallel executor
+# (LocalExecutor/Celery/Kubernetes, as in docker/airflow-compose.yml); under
+# SequentialExecutor they still run one at a time
+MAX_PARALLEL_FILES = int(os.getenv("STREAM_MAX_PARALLEL_FILES", "4"))
 
 # TODO(Storage): switch to fsspec (S3/MinIO) via env flag; keep local paths for now.
 
@@ -33,88 +39,65 @@ with DAG(
 
     def _list_new_files(**context):
         files = list(INCOMING_DIR.glob("*.csv"))
-        new_files = [str(f) for f in files if not already_processed(f)]
+        new_files = [str(f) for f in filter_unprocessed(files)]
         context["ti"].xcom_push(key="new_files", value=new_files)
         return new_files
 
-    def _process_file(ds=None, **context):
-        from pathlib import Path
-
-        ti = context["ti"]
-        new_files = ti.xcom_pull(key="new_files", task_ids="list_new_files") or []
-        if not new_files:
-            logging.info("No new files to process.")
-            # push empty lists so downstream doesn't break
-            ti.xcom_push(key="processed_files", value=[])
-            ti.xcom_push(key="failed_files", value=[])
-            return None
-
+    def _process_file(fpath, ds=None, **context):
+        """Score one incoming CSV; runs as one mapped task instance per file."""
+        src_path = Path(fpath)
         ds_str = ds or context.get("ds")
         out_dir = SCORED_DIR / f"dt={ds_str}"
         out_dir.mkdir(parents=True, exist_ok=True)
 
-        processed_files = []
-        failed_files = []
-
-        for fpath in new_files:
-            src_path = Path(fpath)
-            try:
-                logging.info("Processing file: %s", src_path.name)
-
-                # 1) Ingest
-                df = ingest(src_path)
-
-                # 2) Clean
-                df = clean(df)
-
-                # 3) Score (multi-label)
-                ml = score_multilabel(df["clean_text"].tolist())
+        try:
+            logging.info("Processing file: %s", src_path.name)
 
-                # attach scores + flagged
-                for col in ml.columns:
-                    df[col] = ml[col].values
-                if "toxicity_score" not in df.columns and "toxic" in df.columns:
-                    df["toxicity_score"] = df["toxic"]
+            # 1) Ingest
+            df = ingest(src_path)
 
-                # 4) Store to partitioned scored dir
-                out_path = out_dir / f"stream_{src_path.stem}.parquet"
-                store(df, out_path)
+            # 2) Clean
+            df = clean(df)
 
-                processed_files.append(str(src_path))
-                logging.info("Wrote: %s", out_path)
-            except Exception:
-                logging.exception("Failed processing %s", src_path.name)
-                failed_files.append(str(src_path))
+            # 3) Score (multi-label, unique texts only) + attach scores/flagged
+            df = attach_scores(df)
 
-        # XCom for archive step
-        ti.xcom_push(key="processed_files", value=processed_files)
-        ti.xcom_push(key="failed_files", value=failed_files)
+            # 4) Store to partitioned scored dir
+            out_path = out_dir / f"stream_{src_path.stem}.parquet"
+            store(df, out_path)
+            logging.info("Wrote: %s", out_path)
+        except Exception:
+            # Report instead of failing the task so archive_file can quarantine it
+            logging.exception("Failed processing %s", src_path.name)
+            return {"path": str(src_path), "ok": False}
 
-        return {"processed_count": len(processed_files), "failed_count": len(failed_files)}
+        return {"path": str(src_path), "ok": True, "out": str(out_path)}
 
     def _archive_file(**context):
-        import json
         import shutil
-        from pathlib import Path
 
-        from moderation.io import STATE_FILE, mark_processed  # ensure available
+        from moderation.io import mark_processed_many, prune_processed
 
         ti = context["ti"]
-        processed_files = ti.xcom_pull(key="processed_files", task_ids="process_file") or []
-        failed_files = ti.xcom_pull(key="failed_files", task_ids="process_file") or []
+        # One result per mapped process_file instance (none if nothing was new)
+        results = [r for r in (ti.xcom_pull(task_ids="process_file") or []) if r]
+        processed_files = [r["path"] for r in results if r["ok"]]
+        failed_files = [r["path"] for r in results if not r["ok"]]
 
         PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
         QUARANTINE_DIR.mkdir(parents=True, exist_ok=True)
 
-        # Move processed -> processed dir and mark processed
+        # Move processed -> processed dir and mark processed (one transaction)
+        archived = []
         for p in processed_files:
             src = Path(p)
             if not src.exists():
                 continue
             dst = PROCESSED_DIR / src.name
             shutil.move(str(src), str(dst))
-            mark_processed(dst)
+            archived.append(dst)
             logging.info("Archived: %s", dst)
+        mark_processed_many(archived)
 
         # Move failed -> quarantine dir (do NOT mark processed)
         for p in failed_files:
@@ -125,19 +108,12 @@ with DAG(
             shutil.move(str(src), str(dst))
             logging.info("Quarantined: %s", dst)
 
-        # Compact the state file if it grows too large
-        try:
-            if STATE_FILE.exists():
-                data = json.loads(STATE_FILE.read_text() or "[]")
-                if isinstance(data, list) and len(data) > MAX_STATE_ENTRIES:
-                    # Keep the most recent entries (simple tail strategy)
-                    trimmed = data[-MAX_STATE_ENTRIES:]
-                    STATE_FILE.write_text(json.dumps(trimmed))
-                    logging.info(
-                        "Compacted state index from %d -> %d entries", len(data), len(trimmed)
-                    )
-        except Exception:
-            logging.exception("Failed to compact processed state file")
+        # Time-based retention for the processed-file index
+        pruned = prune_processed(timedelta(days=STATE_RETENTION_DAYS))
+        if pruned:
+            logging.info(
+                "Pruned %d processed-file entries older than %d days", pruned, STATE_RETENTION_DAYS
+            )
 
         return {
             "archived": len(processed_files),
@@ -145,7 +121,17 @@ with DAG(
         }
 
     list_new_files = PythonOperator(task_id="list_new_files", python_callable=_list_new_files)
-    process_file = PythonOperator(task_id="process_file", python_callable=_process_file)
-    archive_file = PythonOperator(task_id="archive_file", python_callable=_archive_file)
+    # Dynamic task mapping: one process_file instance per new file, at most
+    # MAX_PARALLEL_FILES running at once
+    process_file = PythonOperator.partial(
+        task_id="process_file",
+        python_callable=_process_file,
+        max_active_tis_per_dagrun=MAX_PARALLEL_FILES,
+    ).expand(op_kwargs=list_new_files.output.map(lambda f: {"fpath": f}))
+    archive_file = PythonOperator(
+        task_id="archive_file",
+        python_callable=_archive_file,
+        trigger_rule="none_failed",  # still runs when there was nothing to map
+    )
 
     list_new_files >> process_file >> archive_file
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import os
 from datetime import datetime, timedelta
 from pathlib import Path
 
@@ -7,13 +8,19 @@ from airflow import DAG
 from airflow.operators.python import PythonOperator  # type: ignore
 
 # Use your existing code in src/moderation/*
-from moderation.pipeline import clean, ingest, score_multilabel, store
+from moderation.io import clear_staging, load_staged, prune_staging, stage_frame
+from moderation.pipeline import attach_scores, clean, ingest, store
 
 # Resolve repo root: .../content-moderation-pipeline
 REPO_ROOT = Path(__file__).resolve().parents[1]
 RAW_CSV = REPO_ROOT / "data" / "raw" / "raw_comments.csv"
 OUT_PARQUET_CLEAN = REPO_ROOT / "data" / "clean" / "cleaned_comments.parquet"
 OUT_PARQUET_SCORED = REPO_ROOT / "data" / "clean" / "scored_comments.parquet"
+# Intermediate Parquet artifacts; tasks pass only their paths through XCom
+STAGING_DIR = REPO_ROOT / "data" / "staging"
+# Failed runs keep their staged inputs so tasks can be cleared/retried; they
+# are swept once older than this
+STAGING_RETENTION_DAYS = int(os.getenv("MOD_STAGING_RETENTION_DAYS", "7"))
 
 default_args = {"owner": "ml", "retries": 1, "retry_delay": timedelta(minutes=2)}
 
@@ -29,64 +36,62 @@ with DAG(
 
     def _extract(**context):
         df = ingest(RAW_CSV)
-        context["ti"].xcom_push(key="raw_records", value=df.to_dict(orient="records"))
+        path = stage_frame(df, context["run_id"], "raw", STAGING_DIR)
+        context["ti"].xcom_push(key="raw_path", value=path)
 
     def _clean(**context):
-        import pandas as pd
-
-        records = context["ti"].xcom_pull(key="raw_records", task_ids="extract")
-        df = pd.DataFrame.from_records(records)
-        cleaned = clean(df)
-        context["ti"].xcom_push(key="clean_records", value=cleaned.to_dict(orient="records"))
+        path = context["ti"].xcom_pull(key="raw_path", task_ids="extract")
+        cleaned = clean(load_staged(path))
+        clean_path = stage_frame(cleaned, context["run_id"], "clean", STAGING_DIR)
+        context["ti"].xcom_push(key="clean_path", value=clean_path)
 
     def _store_clean(**context):
-        import pandas as pd
-
-        records = context["ti"].xcom_pull(key="clean_records", task_ids="clean_text")
-        df = pd.DataFrame.from_records(records)
-        path = store(df, OUT_PARQUET_CLEAN)
-        return str(path)
+        path = context["ti"].xcom_pull(key="clean_path", task_ids="clean_text")
+        out = store(load_staged(path), OUT_PARQUET_CLEAN)
+        return str(out)
 
     def _score(**context):
-        import pandas as pd
-
-        records = context["ti"].xcom_pull(key="clean_records", task_ids="clean_text")
-        df = pd.DataFrame.from_records(records)
-
-        # Multi-label scoring on clean_text
-        ml = score_multilabel(df["clean_text"].to_list())  # DataFrame with label columns + flagged
+        path = context["ti"].xcom_pull(key="clean_path", task_ids="clean_text")
+        df = load_staged(path)
 
-        # Attach all new columns
-        for col in ml.columns:
-            df[col] = ml[col].values
+        # Multi-label scoring on unique clean_text values, broadcast back to rows
+        # (adds toxicity_score, label columns + flagged)
+        df = attach_scores(df)
 
-        # Optional - keep legacy single column for continuity
-        if "toxicity_score" not in df.columns and "toxic" in df.columns:
-            df["toxicity_score"] = df["toxic"]
-
-        context["ti"].xcom_push(key="scored_records", value=df.to_dict(orient="records"))
+        scored_path = stage_frame(df, context["run_id"], "scored", STAGING_DIR)
+        context["ti"].xcom_push(key="scored_path", value=scored_path)
 
     def _store_scored(ds=None, **context):
-        import pandas as pd
-
-        records = context["ti"].xcom_pull(key="scored_records", task_ids="score")
-        df = pd.DataFrame.from_records(records)
+        path = context["ti"].xcom_pull(key="scored_path", task_ids="score")
+        df = load_staged(path)
 
         # Partitioned path: data/scored/st=<ds>/cleaned_scored.parquet
         ds_str = ds or context.get("ds")
         out_path = REPO_ROOT / "data" / "scored" / f"dt={ds_str}" / "cleaned_scored.parquet"
         out_path.parent.mkdir(parents=True, exist_ok=True)
 
-        path = store(df, out_path)
-        return str(path)
+        out = store(df, out_path)
+        return str(out)
+
+    def _cleanup_staging(**context):
+        clear_staging(context["run_id"], STAGING_DIR)
+        prune_staging(timedelta(days=STAGING_RETENTION_DAYS), STAGING_DIR)
 
     extract = PythonOperator(task_id="extract", python_callable=_extract)
     clean_text = PythonOperator(task_id="clean_text", python_callable=_clean)
     store_clean = PythonOperator(task_id="store_clean", python_callable=_store_clean)
     score = PythonOperator(task_id="score", python_callable=_score)
     store_scored = PythonOperator(task_id="store_scored", python_callable=_store_scored)
+    cleanup_staging = PythonOperator(
+        task_id="cleanup_staging",
+        python_callable=_cleanup_staging,
+        # Only after success: a failed run's staged inputs are what a retry
+        # or clear of the failed task reads (see STAGING_RETENTION_DAYS)
+        trigger_rule="all_success",
+    )
 
     # Graph
     extract >> clean_text
     clean_text >> store_clean
     clean_text >> score >> store_scored
+    [store_clean, store_scored] >> cleanup_staging
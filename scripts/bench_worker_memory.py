@@ -0,0 +1,102 @@
+"""
+Measure memory per API worker with and without preloading the model.
+
+Starts gunicorn (src/service/gunicorn_conf.py) with MOD_PRELOAD=1 and then
+MOD_PRELOAD=0, waits until the workers answer /ready and reports, per mode:
+
+- pss_total: proportional set size summed over master + workers; shared
+  pages are split between the processes that map them, so this is what the
+  node actually pays
+- uss_worker: memory unique to each worker (avg), i.e. the cost of one more
+
+    PYTHONPATH=src python scripts/bench_worker_memory.py --workers 4
+
+Needs psutil and the model available locally (PSS/USS are Linux-only).
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+import psutil
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+CONF = REPO_ROOT / "src" / "service" / "gunicorn_conf.py"
+MB = 1024 * 1024
+
+
+def _ready(url: str) -> bool:
+    try:
+        with urllib.request.urlopen(url, timeout=2) as resp:  # noqa: S310 - local URL
+            return resp.status == 200
+    except OSError:
+        return False
+
+
+def _wait_ready(url: str, workers: int, timeout_s: float) -> None:
+    # Requests land on arbitrary workers, so require a run of successes
+    deadline = time.monotonic() + timeout_s
+    streak = 0
+    while streak < 4 * workers:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{url} not ready after {timeout_s:.0f}s")
+        streak = streak + 1 if _ready(url) else 0
+        time.sleep(0.05 if streak else 0.5)
+
+
+def measure(preload: bool, workers: int, port: int, timeout_s: float) -> dict:
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join([str(REPO_ROOT / "src"), os.environ.get("PYTHONPATH", "")]),
+        "MOD_PRELOAD": "1" if preload else "0",
+        "MOD_WEB_WORKERS": str(workers),
+        "MOD_BIND": f"127.0.0.1:{port}",
+    }
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(  # noqa: S603 - fixed argv
+        [sys.executable, "-m", "gunicorn", "-c", str(CONF), "service.app:app"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        _wait_ready(f"http://127.0.0.1:{port}/ready", workers, timeout_s)
+        startup_s = time.perf_counter() - t0
+        time.sleep(2)  # let allocations settle
+
+        master = psutil.Process(proc.pid)
+        children = master.children()
+        mem = [p.memory_full_info() for p in [master, *children]]
+        return {
+            "mode": "preload" if preload else "per-worker",
+            "workers": len(children),
+            "startup_s": round(startup_s, 1),
+            "pss_total_mb": round(sum(m.pss for m in mem) / MB, 1),
+            "uss_worker_mb": round(sum(m.uss for m in mem[1:]) / max(len(children), 1) / MB, 1),
+            "rss_worker_mb": round(sum(m.rss for m in mem[1:]) / max(len(children), 1) / MB, 1),
+        }
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=300.0, help="Startup timeout (s)")
+    args = parser.parse_args()
+
+    rows = [measure(preload, args.workers, args.port, args.timeout) for preload in (True, False)]
+    cols = list(rows[0])
+    print("  ".join(f"{c:>14}" for c in cols))
+    for row in rows:
+        print("  ".join(f"{row[c]!s:>14}" for c in cols))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import inspect
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+
+# Scoring backends. Every backend is a callable with the HF text-classification
+# pipeline contract (top_k=None): model(texts, truncation=True, batch_size=...)
+# -> list[list[{"label": str, "score": float}]], plus a `.tokenizer` attribute.
+#
+#   torch      - transformers.pipeline on PyTorch (default)
+#   onnx       - the same model exported to ONNX, run with ONNX Runtime
+#   onnx-int8  - ONNX export + dynamic int8 weight quantization
+#
+# The ONNX backends need `onnxruntime` (and `onnx` for export), which are not
+# part of the base requirements.
+
+MODEL_NAME = "unitary/toxic-bert"
+BACKEND = os.getenv("MOD_SCORING_BACKEND", "torch")
+ONNX_DIR = Path(os.getenv("MOD_ONNX_DIR", ".data/onnx"))
+ONNX_OPSET = 17
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+log = logging.getLogger(__name__)
+
+
+def load_torch_pipeline(model_name: str = MODEL_NAME):
+    from transformers import pipeline
+
+    return pipeline(
+        "text-classification",
+        model=model_name,
+        tokenizer=model_name,
+        top_k=None,
+    )
+
+
+def export_onnx(
+    out_dir: str | Path = ONNX_DIR,
+    model_name: str = MODEL_NAME,
+    quantize: bool = False,
+) -> Path:
+    """
+    Export `model_name` to `out_dir/model.onnx` (and `model.int8.onnx` when
+    `quantize`), saving tokenizer + config alongside. Returns the model path.
+    Existing exports are reused.
+    """
+    out_dir = Path(out_dir)
+    fp32_path = out_dir / "model.onnx"
+    int8_path = out_dir / "model.int8.onnx"
+
+    if not fp32_path.exists():
+        import torch
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+        out_dir.mkdir(parents=True, exist_ok=True)
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModelForSequenceClassification.from_pretrained(model_name).eval()
+
+        sample = tokenizer(["export sample"], return_tensors="pt")
+        # ONNX input names bind positionally, so follow forward()'s parameter order
+        params = inspect.signature(model.forward).parameters
+        input_names = [name for name in params if name in sample]
+        dynamic = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic["logits"] = {0: "batch"}
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                (dict(sample),),
+                str(fp32_path),
+                input_names=input_names,
+                output_names=["logits"],
+                dynamic_axes=dynamic,
+                opset_version=ONNX_OPSET,
+                dynamo=False,
+            )
+        tokenizer.save_pretrained(out_dir)
+        model.config.save_pretrained(out_dir)
+        log.info("Exported %s to %s", model_name, fp32_path)
+
+    if not quantize:
+        return fp32_path
+
+    if not int8_path.exists():
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(str(fp32_path), str(int8_path), weight_type=QuantType.QInt8)
+        log.info("Quantized %s to %s", fp32_path, int8_path)
+    return int8_path
+
+
+class OnnxTextClassifier:
+    """ONNX Runtime drop-in for the HF text-classification pipeline (top_k=None)."""
+
+    def __init__(self, model_dir: str | Path, model_file: str = "model.onnx"):
+        import onnxruntime as ort
+        from transformers import AutoConfig, AutoTokenizer
+
+        model_dir = Path(model_dir)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        config = AutoConfig.from_pretrained(model_dir)
+        self.labels = [config.id2label[i] for i in range(config.num_labels)]
+        # Same post-processing rule the HF pipeline uses
+        self.sigmoid = config.problem_type == "multi_label_classification" or (
+            config.num_labels == 1
+        )
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        threads = os.getenv("MOD_ONNX_THREADS")
+        if threads:
+            opts.intra_op_num_threads = int(threads)
+        self.session = ort.InferenceSession(
+            str(model_dir / model_file), opts, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def _scores(self, logits: np.ndarray) -> np.ndarray:
+        if self.sigmoid:
+            return 1.0 / (1.0 + np.exp(-logits))
+        shifted = np.exp(logits - logits.max(axis=-1, keepdims=True))
+        return shifted / shifted.sum(axis=-1, keepdims=True)
+
+    def __call__(self, texts, truncation: bool = True, batch_size: int = 32, **_):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        bs = max(int(batch_size), 1)
+        out: list[list[dict]] = []
+        for i in range(0, len(texts), bs):
+            enc = self.tokenizer(
+                texts[i : i + bs],
+                padding=True,
+                truncation=truncation,
+                return_tensors="np",
+            )
+            feed = {k: v.astype(np.int64) for k, v in enc.items() if k in self._input_names}
+            (logits,) = self.session.run(["logits"], feed)
+            for row in self._scores(logits):
+                items = [
+                    {"label": lab, "score": float(s)}
+                    for lab, s in zip(self.labels, row, strict=True)
+                ]
+                out.append(sorted(items, key=lambda x: x["score"], reverse=True))
+        return out[0] if single else out
+
+
+def load_backend(name: str = BACKEND, model_name: str = MODEL_NAME):
+    """Build the scoring model for backend `name` (see BACKENDS)."""
+    if name == "torch":
+        return load_torch_pipeline(model_name)
+    if name in ("onnx", "onnx-int8"):
+        model_path = export_onnx(ONNX_DIR, model_name, quantize=name == "onnx-int8")
+        return OnnxTextClassifier(model_path.parent, model_path.name)
+    raise ValueError(f"Unknown scoring backend {name!r}; expected one of {BACKENDS}")
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+import time
+from collections.abc import Callable, Sequence
+from concurrent.futures import Future
+from typing import Any
+
+from .metrics import LatencyHistogram
+
+log = logging.getLogger(__name__)
+
+
+class QueueFullError(RuntimeError):
+    """Raised by `submit` when the pending queue is at capacity."""
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent single-item requests into batched calls.
+
+    Callers `submit()` one item and get a Future back. A worker thread
+    collects queued items until either `max_batch_size` items are waiting or
+    `max_wait_ms` has passed since the first one arrived, runs `fn` once on the
+    whole batch and resolves each caller's Future with its own result.
+
+    `fn` must take a list of items and return a sequence of results in the same
+    order (one per item).
+
+    `workers` dedicated threads run batches (the inference executor). At most
+    `max_queue` items may wait for a worker (0 = unbounded); beyond that
+    `submit` raises QueueFullError so callers can shed load instead of queueing
+    without limit.
+
+    `stats()` reports batch counts, the batch-size distribution and how long
+    `fn` took per batch.
+    """
+
+    def __init__(
+        self,
+        fn: Callable[[list[Any]], Sequence[Any]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        workers: int = 1,
+        max_queue: int = 0,
+        name: str = "micro-batcher",
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+        if workers < 1:
+            raise ValueError("workers must be >= 1")
+        self.fn = fn
+        self.max_batch_size = int(max_batch_size)
+        self.max_wait_s = max(float(max_wait_ms), 0.0) / 1000.0
+        self.workers = int(workers)
+        self.max_queue = max(int(max_queue), 0)
+        self.name = name
+        self._queue: queue.Queue[tuple[Any, Future]] = queue.Queue(maxsize=self.max_queue)
+        self._lock = threading.Lock()
+        self._threads: list[threading.Thread] = []
+        self._stats_lock = threading.Lock()
+        self._size_counts = [0] * (self.max_batch_size + 1)
+        self._duration = LatencyHistogram()
+
+    @property
+    def depth(self) -> int:
+        """Items waiting for a worker."""
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        """Batches run, items scored, `size_counts[n]` = batches of n items, fn duration."""
+        with self._stats_lock:
+            sizes = list(self._size_counts)
+            duration = self._duration.copy()
+        return {
+            "batches": sum(sizes),
+            "items": sum(n * c for n, c in enumerate(sizes)),
+            "size_counts": sizes,
+            "duration_ms": duration,
+        }
+
+    def start(self) -> None:
+        """Start the worker threads (idempotent; `submit` calls it lazily)."""
+        if len(self._threads) == self.workers:
+            return
+        with self._lock:
+            while len(self._threads) < self.workers:
+                t = threading.Thread(
+                    target=self._run, name=f"{self.name}-{len(self._threads)}", daemon=True
+                )
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, item: Any) -> Future:
+        """Queue one item for the next batch and return a Future for its result."""
+        return self.submit_many([item])[0]
+
+    def submit_many(self, items: Sequence[Any]) -> list[Future]:
+        """Queue several items at once; either all are accepted or none are."""
+        self.start()
+        futs: list[Future] = [Future() for _ in items]
+        with self._lock:
+            if self.max_queue and self._queue.qsize() + len(items) > self.max_queue:
+                raise QueueFullError(f"queue full ({self._queue.qsize()}/{self.max_queue} pending)")
+            for item, fut in zip(items, futs, strict=True):
+                self._queue.put_nowait((item, fut))
+        return futs
+
+    def _collect(self) -> list[tuple[Any, Future]]:
+        # Block for the first item, then keep collecting until the batch is full
+        # or the wait window (measured from the first item) closes.
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait_s
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            # Drop callers that already gave up
+            batch = [(item, fut) for item, fut in batch if fut.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            items = [item for item, _ in batch]
+            t0 = time.perf_counter()
+            try:
+                results = self.fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(
+                        f"batch fn returned {len(results)} results for {len(items)} items"
+                    )
+            except Exception as exc:
+                log.exception("batch of %d failed", len(items))
+                for _, fut in batch:
+                    fut.set_exception(exc)
+                continue
+            finally:
+                with self._stats_lock:
+                    self._size_counts[len(items)] += 1
+                    self._duration.observe((time.perf_counter() - t0) * 1000.0)
+            for (_, fut), res in zip(batch, results, strict=True):
+                fut.set_result(res)
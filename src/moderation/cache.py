@@ -1,47 +1,440 @@
 from __future__ import annotations
 
+import atexit
 import json
+import os
 import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Iterable
 from pathlib import Path
 
-DB_PATH = Path(".data/mod_cache.db")
+DB_PATH = Path(os.getenv("MOD_CACHE_DB", ".data/mod_cache.db"))
 
+# Buffered writes are flushed when this many are pending or on the timer below
+FLUSH_MAX_PENDING = int(os.getenv("MOD_CACHE_FLUSH_MAX_PENDING", "256"))
+FLUSH_INTERVAL_S = float(os.getenv("MOD_CACHE_FLUSH_INTERVAL_S", "0.5"))
 
-def _conn():
-    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    con = sqlite3.connect(DB_PATH)
-    con.execute(
+# In-process tier in front of SQLite
+MEM_MAX_ENTRIES = int(os.getenv("MOD_CACHE_MEM_MAX_ENTRIES", "100000"))
+MEM_MAX_BYTES = int(os.getenv("MOD_CACHE_MEM_MAX_BYTES", str(64 * 1024 * 1024)))
+MEM_TTL_S = float(os.getenv("MOD_CACHE_MEM_TTL_S", "600"))
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS requests (
+        request_hash TEXT PRIMARY KEY,
+        score REAL NOT NULL,
+        flagged INTEGER NOT NULL,
+        labels_json TEXT NOT NULL
+    )
+"""
+
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",  # safe with WAL; fsync only at checkpoints
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",  # ~16 MB page cache per connection
+    "PRAGMA mmap_size=134217728",  # 128 MB
+)
+
+_SELECT = "SELECT score, flagged, labels_json FROM requests WHERE request_hash=?"
+_UPSERT = (
+    "INSERT OR REPLACE INTO requests(request_hash, score, flagged, labels_json) VALUES(?,?,?,?)"
+)
+
+# SQLite's default limit on bound parameters per statement is 999 on older builds
+_MAX_VARS = 900
+
+
+def _decode(row) -> dict:
+    score, flagged, labels_json = row
+    return {"score": float(score), "flagged": bool(flagged), "labels": json.loads(labels_json)}
+
+
+class SQLiteCache:
+    """
+    SQLite-backed result cache.
+
+    - one connection per thread, opened once and reused
+    - WAL journal + tuned pragmas, schema created once at startup
+    - `put` buffers rows in memory; a background thread writes them in a
+      single transaction every `flush_interval_s`, or as soon as
+      `flush_max_pending` rows are waiting. Writers never block on SQLite
+      (with `flush_interval_s <= 0` there is no thread and a full buffer is
+      flushed by the caller)
+    - reads see buffered (not yet flushed) writes
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        flush_max_pending: int = FLUSH_MAX_PENDING,
+        flush_interval_s: float = FLUSH_INTERVAL_S,
+    ):
+        self.path = Path(path)
+        self.flush_max_pending = max(int(flush_max_pending), 1)
+        self.flush_interval_s = float(flush_interval_s)
+        self._local = threading.local()
+        self._conns: list[sqlite3.Connection] = []
+        self._conns_lock = threading.Lock()
+        self._pending: dict[str, tuple] = {}
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._wake = threading.Event()
+        self._flusher: threading.Thread | None = None
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        con = self._conn()
+        con.execute(_SCHEMA)
+        con.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.path, timeout=30.0, check_same_thread=False)
+            for pragma in _PRAGMAS:
+                con.execute(pragma)
+            self._local.con = con
+            with self._conns_lock:
+                self._conns.append(con)
+        return con
+
+    def _ensure_flusher(self) -> None:
+        if self.flush_interval_s <= 0 or self._flusher is not None:
+            return
+        with self._pending_lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(
+                    target=self._flush_loop, name="cache-flusher", daemon=True
+                )
+                self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        while not self._closed.is_set():
+            self._wake.wait(self.flush_interval_s)
+            self._wake.clear()
+            if self._closed.is_set():
+                return
+            try:
+                self.flush()
+            except sqlite3.Error:
+                # Keep the rows buffered and retry on the next tick
+                continue
+
+    def get(self, request_hash: str) -> dict | None:
+        with self._pending_lock:
+            row = self._pending.get(request_hash)
+        if row is None:
+            row = self._conn().execute(_SELECT, (request_hash,)).fetchone()
+            if not row:
+                return None
+        return _decode(row)
+
+    def get_many(self, request_hashes: Iterable[str]) -> dict[str, dict]:
+        """Bulk lookup; returns {hash: value} for the keys that were found."""
+        keys = list(dict.fromkeys(request_hashes))
+        found: dict[str, dict] = {}
+        with self._pending_lock:
+            for k in keys:
+                row = self._pending.get(k)
+                if row is not None:
+                    found[k] = _decode(row)
+        missing = [k for k in keys if k not in found]
+        con = self._conn()
+        for i in range(0, len(missing), _MAX_VARS):
+            chunk = missing[i : i + _MAX_VARS]
+            marks = ",".join("?" * len(chunk))
+            sql = (
+                "SELECT request_hash, score, flagged, labels_json FROM requests "  # noqa: S608
+                f"WHERE request_hash IN ({marks})"
+            )
+            for h, *rest in con.execute(sql, chunk):
+                found[h] = _decode(rest)
+        return found
+
+    def put(self, request_hash: str, score: float, flagged: bool, labels: dict) -> None:
+        self.put_many([(request_hash, score, flagged, labels)])
+
+    def put_many(self, rows: Iterable[tuple[str, float, bool, dict]]) -> None:
+        """Buffer many (hash, score, flagged, labels) rows for the next flush."""
+        encoded = {
+            h: (float(score), int(bool(flagged)), json.dumps(labels, separators=(",", ":")))
+            for h, score, flagged, labels in rows
+        }
+        with self._pending_lock:
+            self._pending.update(encoded)
+            full = len(self._pending) >= self.flush_max_pending
+        if self.flush_interval_s <= 0:
+            if full:
+                self.flush()
+            return
+        self._ensure_flusher()
+        if full:
+            # Hand the write to the flusher: callers may be on the event loop,
+            # and a flush can wait on another process holding the write lock
+            self._wake.set()
+
+    def flush(self) -> int:
+        """Write all buffered rows in one transaction; returns the number written."""
+        with self._flush_lock:
+            with self._pending_lock:
+                if not self._pending:
+                    return 0
+                batch = self._pending
+                self._pending = {}
+            try:
+                with self._conn() as con:
+                    con.executemany(_UPSERT, [(h, *v) for h, v in batch.items()])
+            except sqlite3.Error:
+                # Put the rows back (without clobbering newer writes) and re-raise
+                with self._pending_lock:
+                    self._pending = {**batch, **self._pending}
+                raise
+            return len(batch)
+
+    def reflag(self, condition_sql: str, params: Iterable = ()) -> int:
+        """
+        Recompute `flagged` for every row in one UPDATE: 1 where `condition_sql`
+        (an SQL expression over labels_json, with `params`) holds, else 0.
+        Returns the number of rows whose flag changed.
         """
-        CREATE TABLE IF NOT EXISTS requests (
-            request_hash TEXT PRIMARY KEY,
-            score REAL NOT NULL,
-            flagged INTEGER NOT NULL,
-            labels_json TEXT NOT NULL
+        self.flush()
+        params = tuple(params)
+        sql = (
+            f"UPDATE requests SET flagged = NOT flagged "  # noqa: S608 - built from constants
+            f"WHERE flagged != (CASE WHEN {condition_sql} THEN 1 ELSE 0 END)"
         )
+        with self._conn() as con:
+            return con.execute(sql, params).rowcount
+
+    def close(self) -> None:
+        self._closed.set()
+        self._wake.set()
+        self.flush()
+        with self._conns_lock:
+            for con in self._conns:
+                con.close()
+            self._conns.clear()
+        self._local = threading.local()
+
+
+def _sizeof(key: str, value: dict) -> int:
+    """Approximate resident size of one decoded cache entry."""
+    labels = value["labels"]
+    size = sys.getsizeof(key) + sys.getsizeof(value) + sys.getsizeof(labels)
+    size += sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in labels.items())
+    return size + 2 * sys.getsizeof(0.0)  # score + flagged
+
+
+class MemoryCache:
     """
-    )
-    return con
+    Bounded in-process LRU with per-entry TTL.
+
+    Holds already-decoded values, so a hit costs a dict lookup. Entries are
+    evicted least-recently-used first once either `max_entries` or
+    `max_bytes` (approximate) is exceeded. Returned values are shared; treat
+    them as read-only.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = MEM_MAX_ENTRIES,
+        max_bytes: int = MEM_MAX_BYTES,
+        ttl_s: float = MEM_TTL_S,
+    ):
+        self.max_entries = int(max_entries)
+        self.max_bytes = int(max_bytes)
+        self.ttl_s = float(ttl_s)
+        self._data: OrderedDict[str, tuple[float, int, dict]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _drop(self, key: str) -> None:
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+    def get(self, key: str) -> dict | None:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires, _, value = entry
+            if expires <= now:
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: dict) -> None:
+        if self.max_entries <= 0 or self.max_bytes <= 0:
+            return
+        size = _sizeof(key, value)
+        expires = time.monotonic() + self.ttl_s
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (expires, size, value)
+            self._bytes += size
+            while self._data and (
+                len(self._data) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                self._drop(next(iter(self._data)))
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "entries": len(self._data),
+                "bytes": self._bytes,
+            }
+
+
+class TieredCache:
+    """Memory LRU tier in front of the SQLite store, with per-tier counters."""
+
+    def __init__(self, store: SQLiteCache, memory: MemoryCache | None = None):
+        self.store = store
+        self.memory = memory if memory is not None else MemoryCache()
+        self._lock = threading.Lock()
+        self.store_hits = 0
+        self.store_misses = 0
+
+    @property
+    def path(self) -> Path:
+        return self.store.path
+
+    def _count_store(self, hits: int, misses: int) -> None:
+        with self._lock:
+            self.store_hits += hits
+            self.store_misses += misses
+
+    def get(self, request_hash: str) -> dict | None:
+        value = self.memory.get(request_hash)
+        if value is not None:
+            return value
+        value = self.store.get(request_hash)
+        self._count_store(int(value is not None), int(value is None))
+        if value is not None:
+            self.memory.put(request_hash, value)
+        return value
+
+    def get_many(self, request_hashes: Iterable[str]) -> dict[str, dict]:
+        found: dict[str, dict] = {}
+        missing = []
+        for h in dict.fromkeys(request_hashes):
+            value = self.memory.get(h)
+            if value is not None:
+                found[h] = value
+            else:
+                missing.append(h)
+        if missing:
+            from_store = self.store.get_many(missing)
+            self._count_store(len(from_store), len(missing) - len(from_store))
+            for h, value in from_store.items():
+                self.memory.put(h, value)
+            found.update(from_store)
+        return found
+
+    def put(self, request_hash: str, score: float, flagged: bool, labels: dict) -> None:
+        self.put_many([(request_hash, score, flagged, labels)])
+
+    def put_many(self, rows: Iterable[tuple[str, float, bool, dict]]) -> None:
+        rows = list(rows)
+        for h, score, flagged, labels in rows:
+            value = {"score": float(score), "flagged": bool(flagged), "labels": dict(labels)}
+            self.memory.put(h, value)
+        self.store.put_many(rows)
+
+    def flush(self) -> int:
+        return self.store.flush()
+
+    def reflag(self, condition_sql: str, params: Iterable = ()) -> int:
+        """SQLiteCache.reflag, then drop the memory tier so no stale flags are served."""
+        changed = self.store.reflag(condition_sql, params)
+        self.memory.clear()
+        return changed
+
+    def close(self) -> None:
+        self.store.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            store = {"hits": self.store_hits, "misses": self.store_misses, "evictions": 0}
+        return {"memory": self.memory.stats(), "sqlite": store}
+
+
+_default: TieredCache | None = None
+_default_lock = threading.Lock()
+
+
+def _cache() -> TieredCache:
+    """Process-wide cache for DB_PATH (re-created if DB_PATH is rebound)."""
+    global _default
+    cache = _default
+    if cache is None or cache.path != Path(DB_PATH):
+        with _default_lock:
+            if _default is None or _default.path != Path(DB_PATH):
+                if _default is not None:
+                    _default.close()
+                _default = TieredCache(SQLiteCache(DB_PATH))
+            cache = _default
+    return cache
 
 
 def get(request_hash: str):
-    con = _conn()
-    cur = con.execute(
-        "SELECT score, flagged, labels_json FROM requests WHERE request_hash=?",
-        (request_hash,),
-    )
-    row = cur.fetchone()
-    con.close()
-    if not row:
-        return None
-    score, flagged, labels_json = row
-    return {"score": float(score), "flagged": bool(flagged), "labels": json.loads(labels_json)}
+    return _cache().get(request_hash)
+
+
+def get_many(request_hashes: Iterable[str]) -> dict[str, dict]:
+    return _cache().get_many(request_hashes)
 
 
 def put(request_hash: str, score: float, flagged: bool, labels: dict) -> None:
-    con = _conn()
-    con.execute(
-        "INSERT OR REPLACE INTO requests(request_hash, score, flagged, labels_json) VALUES(?,?,?,?)",
-        (request_hash, float(score), int(bool(flagged)), json.dumps(labels, separators=(",", ":"))),
-    )
-    con.commit()
-    con.close()
+    _cache().put(request_hash, score, flagged, labels)
+
+
+def put_many(rows: Iterable[tuple[str, float, bool, dict]]) -> None:
+    _cache().put_many(rows)
+
+
+def flush() -> int:
+    return _cache().flush() if _default is not None else 0
+
+
+def reflag(condition_sql: str, params: Iterable = ()) -> int:
+    return _cache().reflag(condition_sql, params)
+
+
+def stats() -> dict:
+    """Hit/miss/eviction counters per tier."""
+    return _cache().stats()
+
+
+@atexit.register
+def _flush_on_exit() -> None:
+    if _default is not None:
+        _default.close()
@@ -1,12 +1,19 @@
 from __future__ import annotations
 
+import os
 import re
+from collections.abc import Sequence
+from concurrent.futures import Executor, ProcessPoolExecutor
 from html import unescape
 
+import pandas as pd
+
 _URL_RE = re.compile(r"https?://\S+|www\.\S+", re.IGNORECASE)
 _HTML_TAG_RE = re.compile(r"<[^>]+>")
 _MULTI_WS_RE = re.compile(r"\s+")
 _PUNCT_FIX_RE = re.compile(r"\s+([!?.,;:])")
+# After whitespace is collapsed to single spaces
+_SPACE_PUNCT_RE = re.compile(r" ([!?.,;:])")
 
 
 def strip_html(text: str) -> str:
@@ -38,3 +45,55 @@ def basic_clean(text: str) -> str:
     t = normalize_whitespace(t)
     t = _PUNCT_FIX_RE.sub(r"\1", t)
     return t
+
+
+def _clean_one(text: str) -> str:
+    # Equivalent to basic_clean for str input. Rows without markup skip
+    # unescape/tag/URL removal; str.split()/join collapses and strips
+    # whitespace in one C pass, after which only single spaces can precede
+    # punctuation.
+    lowered = text.lower()
+    if "<" in text or "&" in text or "http" in lowered or "www" in lowered:
+        return basic_clean(text)
+    t = " ".join(lowered.split())
+    return _SPACE_PUNCT_RE.sub(r"\1", t) if " " in t else t
+
+
+def _clean_values(values: Sequence) -> list[str]:
+    # basic_clean maps None to "" but other values through str() (NaN -> "nan")
+    return [
+        _clean_one(v) if type(v) is str else ("" if v is None else _clean_one(str(v)))
+        for v in values
+    ]
+
+
+def clean_series(
+    texts: pd.Series,
+    workers: int = 1,
+    chunk_size: int = 100_000,
+    executor: Executor | None = None,
+) -> pd.Series:
+    """
+    Column-at-a-time basic_clean with identical output per row.
+
+    Only rows that contain `<`, `&`, `http` or `www` go through HTML/URL
+    stripping; the rest take a fused lowercase/whitespace/punctuation pass.
+
+    With `workers` > 1 (0 = all cores) columns longer than `chunk_size` are
+    split into chunks and cleaned on a process pool; pass `executor` to reuse
+    a pool across calls.
+    """
+    values = texts.to_numpy(dtype=object)
+    workers = workers or os.cpu_count() or 1
+    parallel = executor is not None or workers > 1
+    if not parallel or len(values) <= chunk_size:
+        out = _clean_values(values)
+    else:
+        chunks = [values[i : i + chunk_size] for i in range(0, len(values), chunk_size)]
+        if executor is not None:
+            parts = list(executor.map(_clean_values, chunks))
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+                parts = list(pool.map(_clean_values, chunks))
+        out = [t for part in parts for t in part]
+    return pd.Series(out, index=texts.index, name=texts.name, dtype=object)
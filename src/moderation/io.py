@@ -2,16 +2,38 @@ from __future__ import annotations
 
 import hashlib
 import json
+import os
+import re
+import shutil
+import time
+from collections.abc import Iterable, Iterator
+from datetime import timedelta
 from pathlib import Path
 
 import pandas as pd
 
-STATE_FILE = Path("data/processed/.processed_index.json")
+from .state import ProcessedIndex
 
+STATE_FILE = Path("data/processed/.processed_index.db")
+LEGACY_STATE_FILE = Path("data/processed/.processed_index.json")
+STAGING_DIR = Path("data/staging")
 
-def read_raw_csv(path: str | Path) -> pd.DataFrame:
-    path = Path(path)
-    df = pd.read_csv(path)
+# How files are identified in the processed index:
+#   content - blake2b of the bytes (renamed/re-delivered duplicates are skipped)
+#   stat    - legacy name + size + mtime
+FINGERPRINT_MODE = os.getenv("MOD_FINGERPRINT_MODE", "content")
+HASH_CHUNK_BYTES = 1024 * 1024
+# Files at least this large get a head/tail sample pre-check before full hashing
+SAMPLE_MIN_BYTES = int(os.getenv("MOD_FINGERPRINT_SAMPLE_MIN_BYTES", str(64 * 1024 * 1024)))
+SAMPLE_BYTES = 1024 * 1024
+# The columns that reach the output (id, text) are always read as strings:
+# otherwise pandas infers dtypes per chunk, and a chunk of numeric-looking
+# comments or ids no longer matches the schema of the Parquet file it is
+# appended to
+READ_DTYPES = {"id": str, "text": str, "comment_text": str}
+
+
+def _normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
     # Expect at least a 'text' column. If there's is a 'common_text' column
     # mirror it into 'text' for consistency
     if "text" not in df.columns:
@@ -22,6 +44,19 @@ def read_raw_csv(path: str | Path) -> pd.DataFrame:
     return df
 
 
+def read_raw_csv(path: str | Path) -> pd.DataFrame:
+    path = Path(path)
+    df = pd.read_csv(path, dtype=READ_DTYPES)
+    return _normalize_columns(df)
+
+
+def iter_raw_csv(path: str | Path, chunksize: int) -> Iterator[pd.DataFrame]:
+    """Like read_raw_csv, but yields DataFrames of at most `chunksize` rows."""
+    with pd.read_csv(Path(path), chunksize=chunksize, dtype=READ_DTYPES) as reader:
+        for chunk in reader:
+            yield _normalize_columns(chunk)
+
+
 def write_parquet(df: pd.DataFrame, out_path: str | Path) -> Path:
     out = Path(out_path)
     out.parent.mkdir(parents=True, exist_ok=True)
@@ -29,38 +64,193 @@ def write_parquet(df: pd.DataFrame, out_path: str | Path) -> Path:
     return out
 
 
-def _load_state() -> set[str]:
-    if STATE_FILE.exists():
-        try:
-            with open(STATE_FILE) as f:
-                return set(json.load(f))
-        except json.JSONDecodeError:
-            return set()
-    return set()
+_state: ProcessedIndex | None = None
+
+
+def _staging_run_dir(run_id: str, staging_dir: str | Path | None = None) -> Path:
+    safe = re.sub(r"[^A-Za-z0-9_.-]", "_", run_id)
+    return Path(staging_dir or STAGING_DIR) / safe
+
+
+def stage_frame(
+    df: pd.DataFrame, run_id: str, name: str, staging_dir: str | Path | None = None
+) -> str:
+    """
+    Write an intermediate DataFrame for one pipeline run and return its path.
+
+    DAG tasks hand each other these paths (small XComs) instead of the rows.
+    """
+    path = _staging_run_dir(run_id, staging_dir) / f"{name}.parquet"
+    tmp = path.with_name(path.name + ".tmp")
+    write_parquet(df, tmp)
+    tmp.replace(path)
+    return str(path)
+
+
+def load_staged(path: str | Path) -> pd.DataFrame:
+    return pd.read_parquet(path)
+
+
+def clear_staging(run_id: str, staging_dir: str | Path | None = None) -> None:
+    """Remove every staged artifact of a run."""
+    shutil.rmtree(_staging_run_dir(run_id, staging_dir), ignore_errors=True)
+
+
+def prune_staging(max_age: timedelta, staging_dir: str | Path | None = None) -> int:
+    """
+    Remove staged run directories not modified for `max_age` (leftovers of
+    failed runs, kept so their tasks could be retried); returns how many.
+    """
+    root = Path(staging_dir or STAGING_DIR)
+    if not root.is_dir():
+        return 0
+    cutoff = time.time() - max_age.total_seconds()
+    removed = 0
+    for run_dir in root.iterdir():
+        if run_dir.is_dir() and run_dir.stat().st_mtime < cutoff:
+            shutil.rmtree(run_dir, ignore_errors=True)
+            removed += 1
+    return removed
 
 
-def _save_state(processed: set[str]) -> None:
-    STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
-    with open(STATE_FILE, "w") as f:
-        json.dump(list(processed), f)
+def _index() -> ProcessedIndex:
+    """Process-wide index for STATE_FILE (re-opened if STATE_FILE is rebound)."""
+    global _state
+    if _state is None or _state.path != Path(STATE_FILE):
+        if _state is not None:
+            _state.close()
+        _state = ProcessedIndex(STATE_FILE)
+        _import_legacy_state(_state)
+    return _state
 
 
-def _file_hash(path: str | Path) -> str:
+def _import_legacy_state(index: ProcessedIndex) -> None:
+    # One-off migration from the old JSON list of hashes
+    legacy = Path(LEGACY_STATE_FILE)
+    if legacy == index.path or not legacy.exists():
+        return
+    try:
+        hashes = json.loads(legacy.read_text() or "[]")
+    except json.JSONDecodeError:
+        hashes = []
+    index.mark_many((h, None) for h in hashes)
+    legacy.rename(legacy.with_name(legacy.name + ".migrated"))
+
+
+def _file_hash(path: str | Path, stat: os.stat_result | None = None) -> str:
     """Generate a simple hash based on filename + size + mtime."""
     p = Path(path)
-    stat = p.stat()
+    stat = stat or p.stat()
     base = f"{p.name}:{stat.st_size}:{stat.st_mtime}"
     return hashlib.sha256(base.encode()).hexdigest()
 
 
+def _stat_key(stat: os.stat_result) -> str:
+    # Same inode, size and mtime => same bytes (survives renames/moves on one FS)
+    return f"{stat.st_dev}:{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _content_hash(path: str | Path) -> str:
+    """Streaming blake2b over the whole file."""
+    h = hashlib.blake2b(digest_size=32)
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_BYTES):
+            h.update(chunk)
+    return "c:" + h.hexdigest()
+
+
+def _sample_hash(path: str | Path, size: int) -> str:
+    """Digest of size + head + tail; equal samples only *suggest* equal files."""
+    h = hashlib.blake2b(str(size).encode(), digest_size=32)
+    with open(path, "rb") as f:
+        h.update(f.read(SAMPLE_BYTES))
+        f.seek(max(size - SAMPLE_BYTES, 0))
+        h.update(f.read(SAMPLE_BYTES))
+    return "s:" + h.hexdigest()
+
+
+def _fingerprints(paths: list[str | Path], index: ProcessedIndex) -> list[str]:
+    """Content fingerprints, re-using ones cached for an unchanged stat signature."""
+    if FINGERPRINT_MODE == "stat":
+        return [_file_hash(p) for p in paths]
+    keys = [_stat_key(os.stat(p)) for p in paths]
+    cached = index.cached_fingerprints(keys)
+    fresh = {}
+    out = []
+    for p, key in zip(paths, keys, strict=True):
+        fp = cached.get(key) or fresh.get(key)
+        if fp is None:
+            fp = fresh[key] = _content_hash(p)
+        out.append(fp)
+    if fresh:
+        index.remember_fingerprints(fresh.items())
+    return out
+
+
+def filter_unprocessed(paths: Iterable[str | Path]) -> list[str | Path]:
+    """
+    Return the paths that have not been processed yet (bulk lookups).
+
+    In "content" mode a renamed/re-delivered copy of a processed file counts as
+    processed. Files whose stat signature was seen before are not re-read;
+    large unseen files are first compared by a head/tail sample and only fully
+    hashed when the sample matches a processed file.
+    """
+    paths = list(paths)
+    index = _index()
+    if FINGERPRINT_MODE == "stat":
+        fps = [_file_hash(p) for p in paths]
+        known = index.known(fps)
+        return [p for p, fp in zip(paths, fps, strict=True) if fp not in known]
+
+    stats = [os.stat(p) for p in paths]
+    cached = index.cached_fingerprints(_stat_key(st) for st in stats)
+
+    # Large files without a cached fingerprint: sample first
+    samples = {
+        i: _sample_hash(p, st.st_size)
+        for i, (p, st) in enumerate(zip(paths, stats, strict=True))
+        if _stat_key(st) not in cached and st.st_size >= SAMPLE_MIN_BYTES
+    }
+    seen_samples = index.known_samples(samples.values())
+    need_full = [i for i in range(len(paths)) if i not in samples or samples[i] in seen_samples]
+
+    fps = dict(zip(need_full, _fingerprints([paths[i] for i in need_full], index), strict=True))
+    # Entries migrated from the JSON index are name/size/mtime hashes
+    legacy = [_file_hash(p, st) for p, st in zip(paths, stats, strict=True)]
+    known = index.known([*fps.values(), *legacy])
+    return [
+        p
+        for i, p in enumerate(paths)
+        if legacy[i] not in known and (i not in fps or fps[i] not in known)
+    ]
+
+
+def mark_processed_many(paths: Iterable[str | Path]) -> None:
+    """Mark several files as processed in a single transaction."""
+    paths = list(paths)
+    index = _index()
+    fps = _fingerprints(paths, index)
+    entries = []
+    for p, fp in zip(paths, fps, strict=True):
+        size = Path(p).stat().st_size
+        sample = None
+        if FINGERPRINT_MODE != "stat" and size >= SAMPLE_MIN_BYTES:
+            sample = _sample_hash(p, size)
+        entries.append((fp, Path(p).name, sample))
+    index.mark_many(entries)
+
+
+def prune_processed(max_age: timedelta) -> int:
+    """Forget files processed longer than `max_age` ago; returns how many."""
+    return _index().prune(max_age.total_seconds())
+
+
 def already_processed(path: str | Path) -> bool:
     """Check if a file has already been processed."""
-    processed = _load_state()
-    return _file_hash(path) in processed
+    return not filter_unprocessed([path])
 
 
 def mark_processed(path: str | Path) -> None:
-    """Mark a file as processed by adding its hash to the state file."""
-    processed = _load_state()
-    processed.add(_file_hash(path))
-    _save_state(processed)
+    """Mark a file as processed by adding its hash to the state store."""
+    mark_processed_many([path])
@@ -1,31 +1,302 @@
 from __future__ import annotations
 
+import bisect
+import math
+import os
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+
+# Log-bucketed latency histogram: bucket i covers (MIN * GROWTH**(i-1), MIN * GROWTH**i]
+# milliseconds, so percentiles are exact to within one bucket (~9% relative)
+# at any scale, in fixed memory. Bucket 0 takes everything <= MIN and the last
+# bucket everything above the top bound (~150 s).
+_HIST_MIN_MS = 0.01
+_HIST_GROWTH = 2 ** (1 / 8)
+_HIST_BUCKETS = 192
+
+STAGES = ("cache_lookup", "inference", "cache_write")
+
+# Prometheus `le` bounds (seconds) the fine histograms are folded into
+PROM_LATENCY_BUCKETS_S = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)  # fmt: skip
+
+_PROCESS_START = time.time()
+
+
+class LatencyHistogram:
+    """Streaming latency histogram with fixed memory. Not thread-safe on its own."""
+
+    bounds_ms = tuple(_HIST_MIN_MS * _HIST_GROWTH**i for i in range(_HIST_BUCKETS))
+
+    def __init__(self):
+        self.counts = [0] * _HIST_BUCKETS
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def copy(self) -> LatencyHistogram:
+        other = LatencyHistogram()
+        other.counts = list(self.counts)
+        other.count, other.sum_ms, other.max_ms = self.count, self.sum_ms, self.max_ms
+        return other
+
+    def cumulative(self, bounds_ms: Iterable[float]) -> list[int]:
+        """Observations per `le` bound; a fine bucket counts once its upper bound fits."""
+        running, total = [], 0
+        for n in self.counts:
+            total += n
+            running.append(total)
+        out = []
+        for le in bounds_ms:
+            i = bisect.bisect_right(self.bounds_ms, le * (1 + 1e-9))
+            out.append(running[i - 1] if i else 0)
+        return out
+
+    def observe(self, ms: float) -> None:
+        ms = max(float(ms), 0.0)
+        if ms <= _HIST_MIN_MS:
+            i = 0
+        else:
+            i = min(math.ceil(math.log(ms / _HIST_MIN_MS, _HIST_GROWTH)), _HIST_BUCKETS - 1)
+        self.counts[i] += 1
+        self.count += 1
+        self.sum_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th percentile (capped at max)."""
+        if not self.count:
+            return 0.0
+        rank = max(math.ceil(q / 100.0 * self.count), 1)
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(self.bounds_ms[i], self.max_ms)
+        return self.max_ms
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "avg": round(self.sum_ms / self.count, 2) if self.count else 0.0,
+            "p50": round(self.percentile(50), 2),
+            "p90": round(self.percentile(90), 2),
+            "p99": round(self.percentile(99), 2),
+            "max": round(self.max_ms, 2),
+        }
+
 
 class Meter:
+    """
+    Request counters plus latency histograms for every request, split by
+    cache hits vs. model calls, and per serving stage (see STAGES).
+    Safe to update from several threads.
+    """
+
     def __init__(self):
+        self._lock = threading.Lock()
         self.requests_total = 0
         self.flagged_total = 0
         self.cache_hits_total = 0
-        self._lat_ms = []
+        self.latency = {
+            "all": LatencyHistogram(),
+            "cache_hit": LatencyHistogram(),
+            "model": LatencyHistogram(),
+        }
+        self.stages = {stage: LatencyHistogram() for stage in STAGES}
+        self.gauges: dict[str, float] = {}
+        self.counters: dict[str, int] = {}
 
     def inc(self, cache_hit: bool, flagged: bool, latency_ms: float):
-        self.requests_total += 1
-        if cache_hit:
-            self.cache_hits_total += 1
-        if flagged:
-            self.flagged_total += 1
-        self._lat_ms.append(float(latency_ms))
-        if len(self._lat_ms) > 1000:
-            self._lat_ms = self._lat_ms[-1000:]
+        with self._lock:
+            self.requests_total += 1
+            if cache_hit:
+                self.cache_hits_total += 1
+            if flagged:
+                self.flagged_total += 1
+            self.latency["all"].observe(latency_ms)
+            self.latency["cache_hit" if cache_hit else "model"].observe(latency_ms)
+
+    def observe_stage(self, stage: str, ms: float):
+        """Record `ms` spent in `stage` (one of STAGES)."""
+        with self._lock:
+            self.stages[stage].observe(ms)
+
+    def count(self, name: str, n: int = 1):
+        """Add `n` to a free-form counter (e.g. prefilter_benign_total)."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + int(n)
+
+    def set_gauge(self, name: str, value: float):
+        """Set a free-form gauge (e.g. model_load_seconds), reported as-is."""
+        with self._lock:
+            self.gauges[name] = float(value)
+
+    @contextmanager
+    def time_stage(self, stage: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(stage, (time.perf_counter() - t0) * 1000.0)
 
     def snapshot(self):
-        lat = self._lat_ms or [0.0]
-        return {
-            "requests_total": self.requests_total,
-            "flagged_total": self.flagged_total,
-            "cache_hits_total": self.cache_hits_total,
-            "latency_ms_avg": round(sum(lat) / len(lat), 2),
-        }
+        with self._lock:
+            return {
+                "requests_total": self.requests_total,
+                "flagged_total": self.flagged_total,
+                "cache_hits_total": self.cache_hits_total,
+                "latency_ms_avg": self.latency["all"].summary()["avg"],
+                "latency_ms": {name: h.summary() for name, h in self.latency.items()},
+                "stage_latency_ms": {name: h.summary() for name, h in self.stages.items()},
+                **self.counters,
+                **self.gauges,
+            }
+
+    def expose(self, out: Exposition) -> None:
+        """Write counters, gauges and latency histograms to `out`."""
+        # Copy under the lock, format outside it
+        with self._lock:
+            counters = (self.requests_total, self.flagged_total, self.cache_hits_total)
+            latency = {name: h.copy() for name, h in self.latency.items() if name != "all"}
+            stages = {name: h.copy() for name, h in self.stages.items()}
+            gauges = dict(self.gauges)
+            extra_counters = dict(self.counters)
+
+        requests, flagged, hits = counters
+        out.add("requests_total", "counter", "Moderation requests served.", requests)
+        out.add("flagged_total", "counter", "Requests flagged as toxic.", flagged)
+        out.add("cache_hits_total", "counter", "Requests answered from the cache.", hits)
+        out.latency_histogram(
+            "request_latency_seconds",
+            "End-to-end request latency by source (cache_hit or model).",
+            [({"source": name}, h) for name, h in latency.items()],
+        )
+        out.latency_histogram(
+            "stage_latency_seconds",
+            "Time spent per serving stage.",
+            [({"stage": name}, h) for name, h in stages.items()],
+        )
+        for name, value in sorted(extra_counters.items()):
+            out.add(name, "counter", f"{name} (see moderation.metrics).", value)
+        for name, value in sorted(gauges.items()):
+            out.add(name, "gauge", f"{name} (see moderation.metrics).", value)
+
+
+def _fmt(value: float) -> str:
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, int):
+        return str(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+class Exposition:
+    """
+    Builder for the Prometheus text exposition format (0.0.4). Metric names
+    get `prefix` unless they start with "process_".
+    """
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self, prefix: str = "moderation_"):
+        self.prefix = prefix
+        self._lines: list[str] = []
+
+    def _name(self, name: str) -> str:
+        return name if name.startswith("process_") else self.prefix + name
+
+    def add(
+        self,
+        name: str,
+        kind: str,
+        help_text: str,
+        samples: float | Iterable[tuple[dict, float]],
+    ) -> None:
+        """Add a counter/gauge: one value, or (labels, value) pairs."""
+        name = self._name(name)
+        if isinstance(samples, int | float):
+            samples = [({}, samples)]
+        self._lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        self._lines += [f"{name}{_labels(lbl)} {_fmt(v)}" for lbl, v in samples]
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        series: Iterable[tuple[dict, Iterable[tuple[float, int]], float, int]],
+    ) -> None:
+        """Add a histogram from (labels, [(le, cumulative count)], sum, count) series."""
+        name = self._name(name)
+        self._lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for labels, buckets, total, count in series:
+            for le, n in buckets:
+                self._lines.append(f"{name}_bucket{_labels({**labels, 'le': _fmt(le)})} {n}")
+            self._lines.append(f"{name}_bucket{_labels({**labels, 'le': '+Inf'})} {count}")
+            self._lines.append(f"{name}_sum{_labels(labels)} {_fmt(total)}")
+            self._lines.append(f"{name}_count{_labels(labels)} {count}")
+
+    def latency_histogram(
+        self,
+        name: str,
+        help_text: str,
+        series: Iterable[tuple[dict, LatencyHistogram]],
+        bounds_s: Iterable[float] = PROM_LATENCY_BUCKETS_S,
+    ) -> None:
+        """Add LatencyHistograms (milliseconds) as a histogram in seconds."""
+        bounds_s = tuple(bounds_s)
+        self.histogram(
+            name,
+            help_text,
+            [
+                (
+                    labels,
+                    zip(bounds_s, h.cumulative(b * 1000.0 for b in bounds_s), strict=True),
+                    h.sum_ms / 1000.0,
+                    h.count,
+                )
+                for labels, h in series
+            ],
+        )
+
+    def render(self) -> str:
+        return "\n".join(self._lines) + "\n"
+
+
+def process_stats() -> dict:
+    """Resident memory, CPU time and start time of this process."""
+    try:
+        import psutil
+
+        proc = psutil.Process()
+        rss = proc.memory_info().rss
+    except ImportError:
+        try:
+            with open("/proc/self/statm") as fh:
+                rss = int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except OSError:
+            rss = 0
+    times = os.times()
+    return {
+        "resident_memory_bytes": rss,
+        "cpu_seconds_total": times.user + times.system,
+        "start_time_seconds": _PROCESS_START,
+    }
 
 
 meter = Meter()
@@ -1,36 +1,114 @@
 from __future__ import annotations
 
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
-from transformers import pipeline
 
-from .cleaning import basic_clean
-from .io import read_raw_csv, write_parquet
+from . import cache as result_cache
+from .backends import BACKEND, load_backend
+from .cleaning import clean_series
+from .io import iter_raw_csv, read_raw_csv, write_parquet
+from .metrics import meter
+from .policy import LABELS, current_policy
+from .prefilter import BENIGN, EMPTY, MODEL, get_prefilter
+
+log = logging.getLogger(__name__)
 
 # Lazy load - so the model doesn not reload every call
 _toxicity_model = None
+# Serializes loading: warmup and the first request's batch thread may race
+_model_lock = threading.Lock()
 MODEL_VERSION = "unitary/toxic-bert@v1"
 
-# Multi label thresholding
-MULTI_LABELS = ["toxic", "severe_toxic", "obscene", "threat", "insult", "identity_hate"]
-THRESHOLD = 0.5  # flag a row if any label >= 0.5
+# Multi label thresholding: a row is flagged if any label reaches its
+# threshold (per-label thresholds and config live in moderation.policy)
+MULTI_LABELS = list(LABELS)
+
+
+def __getattr__(name: str):
+    # THRESHOLD predates per-label policies; it follows the current policy's
+    # default instead of freezing 0.5 at import time
+    if name == "THRESHOLD":
+        return current_policy().default
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _parse_buckets(spec: str) -> list[tuple[int, int]]:
+    """Parse "32:128,64:64" into [(32, 128), (64, 64)], sorted by max token length."""
+    buckets = []
+    for part in spec.split(","):
+        max_len, batch_size = part.split(":")
+        buckets.append((int(max_len), int(batch_size)))
+    return sorted(buckets)
+
+
+# Length-bucketed batching: texts are sorted by token length and run in
+# "max_tokens:batch_size" buckets, so short comments are not padded to the
+# longest text in their batch. The last bucket also takes anything longer.
+LENGTH_BUCKETS = _parse_buckets(os.getenv("MOD_LENGTH_BUCKETS", "32:128,64:64,128:32,256:16,512:8"))
+# Texts per tokenizer call when measuring lengths for bucketing
+LENGTH_SLICE_ROWS = 4096
+
+# Batch scoring reads/writes the same result cache as the API
+BATCH_USE_CACHE = os.getenv("MOD_BATCH_USE_CACHE", "1") == "1"
+
+# Parallel cleaning: processes used by clean() (1 = in-process, 0 = all cores)
+# and rows per chunk sent to each of them
+CLEAN_WORKERS = int(os.getenv("MOD_CLEAN_WORKERS", "1"))
+CLEAN_CHUNK_ROWS = int(os.getenv("MOD_CLEAN_CHUNK_ROWS", "100000"))
+
+# Long-document mode: instead of truncating at the model's max length, texts
+# longer than WINDOW_TOKENS are split into overlapping token windows (at most
+# MAX_WINDOWS per text, always including the first and last), every window of
+# every text goes through the same length-bucketed batches, and per-label
+# scores are reduced back per text with WINDOW_AGG ("max" or "mean").
+# WINDOW_TOKENS excludes the model's special tokens ([CLS]/[SEP] for BERT)
+LONG_DOCS = os.getenv("MOD_LONG_DOCS", "0") == "1"
+WINDOW_TOKENS = int(os.getenv("MOD_WINDOW_TOKENS", "510"))
+WINDOW_OVERLAP = int(os.getenv("MOD_WINDOW_OVERLAP", "128"))
+MAX_WINDOWS = int(os.getenv("MOD_MAX_WINDOWS", "8"))
+WINDOW_AGG = os.getenv("MOD_WINDOW_AGG", "max")
+if WINDOW_AGG not in ("max", "mean"):
+    raise ValueError(f"MOD_WINDOW_AGG must be 'max' or 'mean', got {WINDOW_AGG!r}")
+if not 0 <= WINDOW_OVERLAP < WINDOW_TOKENS:
+    raise ValueError("MOD_WINDOW_OVERLAP must be >= 0 and smaller than MOD_WINDOW_TOKENS")
+
+_WORD_RE = re.compile(r"\S+")
 
 
 def ingest(raw_csv_path: str | Path) -> pd.DataFrame:
     return read_raw_csv(raw_csv_path)
 
 
-def clean(df: pd.DataFrame) -> pd.DataFrame:
-    cleaned = df.copy()
-    cleaned["clean_text"] = cleaned["text"].map(basic_clean)
-    # Keep a tidy schema: id (if present), text (raw), clean_text
-    cols = ["clean_text"]
-    if "text" in cleaned.columns:
-        cols.insert(0, "text")
-    if "id" in cleaned.columns:
-        cols.insert(0, "id")
-    return cleaned[cols]
+def clean(
+    df: pd.DataFrame,
+    workers: int | None = None,
+    chunk_size: int | None = None,
+    executor: Executor | None = None,
+) -> pd.DataFrame:
+    """
+    Add `clean_text` and keep a tidy schema: id (if present), text (raw),
+    clean_text. Other columns are never copied. `workers`/`chunk_size`
+    default to CLEAN_WORKERS/CLEAN_CHUNK_ROWS (see clean_series).
+    """
+    clean_text = clean_series(
+        df["text"],
+        workers=CLEAN_WORKERS if workers is None else workers,
+        chunk_size=chunk_size or CLEAN_CHUNK_ROWS,
+        executor=executor,
+    )
+    cols = ["id", "text"] if "id" in df.columns else ["text"]
+    return df[cols].assign(clean_text=clean_text)
 
 
 def store(df: pd.DataFrame, out_parquet: str | Path) -> Path:
@@ -40,21 +118,155 @@ def store(df: pd.DataFrame, out_parquet: str | Path) -> Path:
 def get_toxicity_model():
     global _toxicity_model
     if _toxicity_model is None:
-        _toxicity_model = pipeline(
-            "text-classification",
-            model="unitary/toxic-bert",
-            tokenizer="unitary/toxic-bert",
-            top_k=None,
-        )
+        with _model_lock:
+            if _toxicity_model is None:
+                # torch (default), onnx or onnx-int8 - see moderation.backends
+                t0 = time.perf_counter()
+                _toxicity_model = load_backend(BACKEND)
+                meter.set_gauge("model_load_seconds", time.perf_counter() - t0)
     return _toxicity_model
 
 
+def _token_lengths(model, texts: list[str]) -> np.ndarray:
+    tokenizer = getattr(model, "tokenizer", None)
+    if tokenizer is None:
+        # ~4 chars per token is close enough for ordering
+        return np.fromiter((len(t) // 4 for t in texts), dtype=np.int64, count=len(texts))
+    # Tokenize in slices and keep only the lengths, so a file of millions of
+    # rows never holds every text's token lists at once
+    lengths = np.empty(len(texts), dtype=np.int64)
+    for start in range(0, len(texts), LENGTH_SLICE_ROWS):
+        enc = tokenizer(
+            texts[start : start + LENGTH_SLICE_ROWS],
+            truncation=True,
+            return_attention_mask=False,
+            return_token_type_ids=False,
+        )
+        ids = enc["input_ids"]
+        lengths[start : start + len(ids)] = [len(x) for x in ids]
+    return lengths
+
+
+def _run_model(model, texts: list[str], buckets: list[tuple[int, int]] | None = None) -> list:
+    """
+    Run the model over texts grouped by token length, with the batch size of
+    each length bucket, and return the results in input order.
+    """
+    if not texts:
+        return []
+    buckets = buckets or LENGTH_BUCKETS
+    lengths = _token_lengths(model, texts)
+    order = np.argsort(lengths, kind="stable")
+    sorted_lengths = lengths[order]
+
+    results: list = [None] * len(texts)
+    start = 0
+    for i, (max_len, batch_size) in enumerate(buckets):
+        last = i == len(buckets) - 1
+        end = len(texts) if last else int(np.searchsorted(sorted_lengths, max_len, side="right"))
+        idx = order[start:end]
+        if len(idx):
+            out = model([texts[j] for j in idx], truncation=True, batch_size=batch_size)
+            for j, r in zip(idx, out, strict=True):
+                results[j] = r
+        start = max(start, end)
+    return results
+
+
+def _token_spans(model, texts: list[str]) -> list[list[tuple[int, int]]]:
+    """(start, end) character offsets of every token, without special tokens."""
+    tokenizer = getattr(model, "tokenizer", None)
+    if tokenizer is not None:
+        try:
+            enc = tokenizer(
+                texts,
+                add_special_tokens=False,
+                return_offsets_mapping=True,
+                truncation=False,
+                verbose=False,
+            )
+        except NotImplementedError:  # slow (pure Python) tokenizers have no offsets
+            enc = {}
+        if enc.get("offset_mapping") is not None:
+            return enc["offset_mapping"]
+    # No offsets available: whitespace-separated words stand in for tokens
+    return [[m.span() for m in _WORD_RE.finditer(t)] for t in texts]
+
+
+def _window_starts(n_tokens: int, size: int, overlap: int, cap: int) -> list[int]:
+    """Token offsets of the windows covering n_tokens (first and last kept when capped)."""
+    if n_tokens <= size:
+        return [0]
+    last = n_tokens - size
+    starts = list(range(0, last, size - overlap)) + [last]
+    if len(starts) > cap:
+        keep = np.linspace(0, len(starts) - 1, max(cap, 1)).round().astype(int)
+        starts = [starts[k] for k in keep]
+    return starts
+
+
+def split_windows(model, texts: list[str]) -> tuple[list[str], np.ndarray]:
+    """
+    Split texts into overlapping windows of WINDOW_TOKENS tokens. Returns the
+    window texts and, for each window, the index of its text (ascending;
+    texts that fit in one window are passed through unchanged).
+    """
+    # A token covers at least one character, so shorter texts need no tokenizing
+    long_idx = [i for i, t in enumerate(texts) if len(t) > WINDOW_TOKENS]
+    spans = dict(zip(long_idx, _token_spans(model, [texts[i] for i in long_idx]), strict=True))
+
+    windows: list[str] = []
+    doc_ids: list[int] = []
+    for i, text in enumerate(texts):
+        offsets = spans.get(i)
+        if offsets is None or len(offsets) <= WINDOW_TOKENS:
+            windows.append(text)
+            doc_ids.append(i)
+            continue
+        for start in _window_starts(len(offsets), WINDOW_TOKENS, WINDOW_OVERLAP, MAX_WINDOWS):
+            end = min(start + WINDOW_TOKENS, len(offsets)) - 1
+            windows.append(text[offsets[start][0] : offsets[end][1]])
+            doc_ids.append(i)
+    return windows, np.asarray(doc_ids, dtype=np.int64)
+
+
+def _label_scores(results: list) -> np.ndarray:
+    """Model output -> (len(results), len(MULTI_LABELS)) array; missing labels are 0."""
+    col = {label: j for j, label in enumerate(MULTI_LABELS)}
+    scores = np.zeros((len(results), len(MULTI_LABELS)))
+    for i, r in enumerate(results):
+        for item in r:
+            j = col.get(item["label"].lower())
+            if j is not None:
+                scores[i, j] = float(item["score"])
+    return scores
+
+
+def _score_long(model, texts: list[str], buckets: list[tuple[int, int]] | None) -> np.ndarray:
+    """Per-label scores for texts of any length, reduced over their windows."""
+    windows, doc_ids = split_windows(model, texts)
+    scores = _label_scores(_run_model(model, windows, buckets))
+    if len(windows) == len(texts):
+        return scores
+
+    first = np.flatnonzero(np.r_[True, doc_ids[1:] != doc_ids[:-1]])
+    counts = np.diff(np.r_[first, len(doc_ids)])
+    meter.count("long_docs_total", int((counts > 1).sum()))
+    meter.count("long_doc_windows_total", int(counts[counts > 1].sum()))
+    if WINDOW_AGG == "max":
+        return np.maximum.reduceat(scores, first, axis=0)
+    return np.add.reduceat(scores, first, axis=0) / counts[:, None]
+
+
 def score_toxicity(texts):
     """
     Given a list of texts, return toxicity probabilities.
     """
+    if not isinstance(texts, list):
+        texts = list(texts)
+
     model = get_toxicity_model()
-    results = model(texts, truncation=True)
+    results = _run_model(model, texts)
 
     # results is a list of [{label: prob, lab: prob, ...}]
     # Extract "toxic" probability
@@ -69,32 +281,242 @@ def score_toxicity(texts):
     return scores
 
 
-def score_multilabel(texts) -> pd.DataFrame:
+def score_multilabel(
+    texts, buckets: list[tuple[int, int]] | None = None, use_prefilter: bool = True
+) -> pd.DataFrame:
     """
     Given a list of texts, return a DataFrame with columns for each label in MULTI_LABELS,
-    plus a boolean 'flagged' column indicating any label >= THRESHOLD.
+    plus a boolean 'flagged' column from the decision policy (moderation.policy).
+
+    Rows are in input order; internally texts are batched by token length
+    (see LENGTH_BUCKETS, or pass `buckets` as [(max_tokens, batch_size), ...]).
+    With LONG_DOCS, long texts are scored over token windows instead of
+    being truncated.
+
+    With the pre-filter enabled (moderation.prefilter), empty and confidently
+    benign texts skip the model: their labels are 0 except `toxic`, which
+    holds the pre-filter's estimate. The share sent to the model is kept in
+    `out.attrs["routed_share"]`.
     """
     if not isinstance(texts, list):
         texts = list(texts)
 
-    model = get_toxicity_model()
-    results = model(texts, truncation=True)  # list[list[{'label', 'score'},...]]
+    prefilter = get_prefilter() if use_prefilter else None
+    if prefilter is None:
+        idx = np.arange(len(texts))
+    else:
+        routes, proba = prefilter.route(texts)
+        idx = np.flatnonzero(routes == MODEL)
+        meter.count("prefilter_empty_total", int((routes == EMPTY).sum()))
+        meter.count("prefilter_benign_total", int((routes == BENIGN).sum()))
+        meter.count("prefilter_model_total", len(idx))
+
+    scores = np.zeros((len(texts), len(MULTI_LABELS)))
+    if prefilter is not None:
+        scores[:, MULTI_LABELS.index("toxic")] = proba
+    if len(idx):
+        model = get_toxicity_model()
+        routed = [texts[i] for i in idx]
+        if LONG_DOCS:
+            scores[idx] = _score_long(model, routed, buckets)
+        else:
+            scores[idx] = _label_scores(_run_model(model, routed, buckets))
+
+    out = pd.DataFrame(scores, columns=MULTI_LABELS)
+    out["flagged"] = current_policy().flags(out)
+    out.attrs["routed_share"] = len(idx) / len(texts) if texts else 0.0
+    return out
 
-    rows = []
-    for r in results:
-        row_scores = {label: 0.0 for label in MULTI_LABELS}
-        for item in r:
-            lab = item["label"].lower()
-            if lab in row_scores:
-                row_scores[lab] = float(item["score"])
-        rows.append(row_scores)
 
-    out = pd.DataFrame(rows)
-    out["flagged"] = (out[MULTI_LABELS] >= THRESHOLD).any(axis=1)
+def score_multilabel_dedup(texts) -> pd.DataFrame:
+    """
+    score_multilabel for bulk data with repeated texts: only unique texts go
+    to the model and their scores are broadcast back to every row. The share
+    of rows saved is logged and kept in `out.attrs["dedup_ratio"]`.
+    """
+    codes, uniques = pd.factorize(pd.Series(texts, dtype=object).fillna(""))
+    scored = score_multilabel(list(uniques))
+    out = scored.iloc[codes].reset_index(drop=True)
+
+    ratio = 1.0 - len(uniques) / len(codes) if len(codes) else 0.0
+    out.attrs["dedup_ratio"] = ratio
+    log.info(
+        "scored %d unique of %d texts (dedup ratio %.1f%%)", len(uniques), len(codes), 100 * ratio
+    )
+    return out
+
+
+def cache_key(text: str) -> str:
+    """
+    Result-cache key shared by the API and batch pipelines (stripped text +
+    model version, + backend when not torch, + pre-filter version and window
+    settings when enabled).
+    """
+    version = MODEL_VERSION
+    if BACKEND != "torch":
+        # onnx-int8 scores differ slightly; keep them apart from torch results
+        version += f"+be:{BACKEND}"
+    prefilter = get_prefilter()
+    if prefilter is not None:
+        version += f"+pf:{prefilter.version}"
+    if LONG_DOCS:
+        version += f"+win:{WINDOW_TOKENS}/{WINDOW_OVERLAP}/{MAX_WINDOWS}/{WINDOW_AGG}"
+    key = f"{text.strip()}|{version}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def to_cache_values(scored: pd.DataFrame) -> list[dict]:
+    """score_multilabel rows -> cache values ({"score", "flagged", "labels"})."""
+    return [
+        {
+            "score": float(row["toxic"]),
+            "flagged": bool(row["flagged"]),
+            "labels": {k: float(row[k]) for k in MULTI_LABELS},
+        }
+        for row in scored.to_dict(orient="records")
+    ]
+
+
+def score_multilabel_cached(texts, scorer=score_multilabel) -> pd.DataFrame:
+    """
+    score_multilabel backed by the shared result cache.
+
+    One bulk lookup for all keys, `scorer` runs on the unique misses only, and
+    new results are bulk-inserted. Rows come back in input order; hit and dedup
+    ratios are logged and kept in `out.attrs`.
+    """
+    texts = ["" if t is None else str(t) for t in texts]
+    keys = [cache_key(t) for t in texts]
+    found = result_cache.get_many(keys)
+
+    misses = {k: t for k, t in zip(keys, texts, strict=True) if k not in found}
+    if misses:
+        fresh = dict(zip(misses, to_cache_values(scorer(list(misses.values()))), strict=True))
+        result_cache.put_many((k, v["score"], v["flagged"], v["labels"]) for k, v in fresh.items())
+        # Batch tasks may exit without running atexit hooks (Airflow ends task
+        # processes with os._exit), so write the results out before returning
+        result_cache.flush()
+        found.update(fresh)
+
+    # Flags are re-derived from the cached label scores, so they always follow
+    # the current policy
+    out = pd.DataFrame([found[k]["labels"] for k in keys], columns=MULTI_LABELS).fillna(0.0)
+    out["flagged"] = current_policy().flags(out)
+
+    unique = len(set(keys))
+    out.attrs["dedup_ratio"] = 1.0 - unique / len(keys) if keys else 0.0
+    out.attrs["cache_hit_ratio"] = 1.0 - len(misses) / unique if unique else 0.0
+    log.info(
+        "scored %d texts: %d unique, %d cache hits, %d sent to the model",
+        len(keys),
+        unique,
+        unique - len(misses),
+        len(misses),
+    )
+    return out
+
+
+def attach_scores(df: pd.DataFrame, use_cache: bool | None = None) -> pd.DataFrame:
+    """
+    Score `clean_text` (unique texts only; through the shared result cache
+    unless disabled) and add toxicity_score, labels and flagged.
+    """
+    use_cache = BATCH_USE_CACHE if use_cache is None else use_cache
+    texts = df["clean_text"].tolist()
+    ml = score_multilabel_cached(texts) if use_cache else score_multilabel_dedup(texts)
+    df["toxicity_score"] = ml["toxic"].values
+
+    # Merge the rest of the labels + flagged
+    for col in MULTI_LABELS + ["flagged"]:
+        df[col] = ml[col].values
+    return df
+
+
+@dataclass(frozen=True)
+class ChunkProgress:
+    chunk: int
+    chunk_rows: int
+    rows_total: int
+    elapsed_s: float
+
+    @property
+    def rows_per_s(self) -> float:
+        return self.rows_total / self.elapsed_s if self.elapsed_s > 0 else 0.0
+
+
+def run_local_streaming(
+    raw_csv_path: str | Path,
+    out_parquet: str | Path,
+    chunksize: int = 50_000,
+    progress: Callable[[ChunkProgress], None] | None = None,
+) -> Path:
+    """
+    Chunked variant of run_local: read `chunksize` rows at a time, clean and
+    score them, and append each chunk as a row group to one Parquet file.
+    Memory is bounded by the chunk size, not the input size. The file is
+    written under a temporary name and moved into place when complete.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    out = Path(out_parquet)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_name(out.name + ".tmp")
+
+    # One cleaning pool for the whole run, forked before the model is loaded
+    workers = CLEAN_WORKERS or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+
+    t0 = time.perf_counter()
+    rows_total = 0
+    writer: pq.ParquetWriter | None = None
+    try:
+        for i, chunk in enumerate(iter_raw_csv(raw_csv_path, chunksize)):
+            shard = min(CLEAN_CHUNK_ROWS, -(-len(chunk) // workers))
+            df = attach_scores(clean(chunk, chunk_size=shard, executor=pool))
+            schema = writer.schema if writer is not None else None
+            table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp, table.schema)
+            writer.write_table(table)
+
+            rows_total += len(df)
+            info = ChunkProgress(i, len(df), rows_total, time.perf_counter() - t0)
+            log.info(
+                "chunk %d: %d rows (%d total, %.0f rows/s)",
+                i,
+                info.chunk_rows,
+                info.rows_total,
+                info.rows_per_s,
+            )
+            if progress is not None:
+                progress(info)
+    except BaseException:
+        if writer is not None:
+            writer.close()
+        tmp.unlink(missing_ok=True)
+        raise
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    if writer is None:
+        raise ValueError(f"No rows in {raw_csv_path}")
+    writer.close()
+    tmp.replace(out)
     return out
 
 
-def run_local(raw_csv_path: str | Path, out_parquet: str | Path) -> Path:
+def run_local(
+    raw_csv_path: str | Path,
+    out_parquet: str | Path,
+    chunksize: int | None = None,
+    progress: Callable[[ChunkProgress], None] | None = None,
+) -> Path:
+    """Score a raw CSV into Parquet; with `chunksize`, stream it (see run_local_streaming)."""
+    if chunksize:
+        return run_local_streaming(raw_csv_path, out_parquet, chunksize, progress)
+
     # 1. Ingest raw
     df = ingest(raw_csv_path)
 
@@ -102,12 +524,7 @@ def run_local(raw_csv_path: str | Path, out_parquet: str | Path) -> Path:
     df = clean(df)
 
     # 3. Score (multi-label)
-    ml = score_multilabel(df["clean_text"].tolist())
-    df["toxicity_score"] = ml["toxic"]
-
-    # Merge the rest of the labels + flagged
-    for col in MULTI_LABELS + ["flagged"]:
-        df[col] = ml[col]
+    df = attach_scores(df)
 
     # 4. Store
     return store(df, out_parquet)
@@ -119,7 +536,13 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run local moderation pipeline")
     parser.add_argument("raw_csv", help="Path to raw CSV with comments")
     parser.add_argument("out_parquet", help="Path to output scored Parquet file")
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=None,
+        help="Stream the CSV in chunks of this many rows (bounded memory)",
+    )
     args = parser.parse_args()
 
-    out_path = run_local(args.raw_csv, args.out_parquet)
+    out_path = run_local(args.raw_csv, args.out_parquet, chunksize=args.chunksize)
     print(f"Wrote scored file to {out_path}")
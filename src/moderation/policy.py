@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Decision policy: a row is flagged when any label score reaches that label's
+# threshold. `flagged` is always derived from the stored label scores, so a
+# policy change only needs `reapply_*` (or a service restart), never the model.
+#
+# Config, in order of precedence:
+#   MOD_POLICY_FILE   JSON: {"default": 0.5, "thresholds": {"threat": 0.3, ...}}
+#   MOD_THRESHOLDS    "threat:0.3,insult:0.6" (per-label overrides)
+#   MOD_THRESHOLD     default for labels without an override
+
+LABELS = ["toxic", "severe_toxic", "obscene", "threat", "insult", "identity_hate"]
+DEFAULT_THRESHOLD = 0.5
+
+log = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Policy:
+    default: float = DEFAULT_THRESHOLD
+    thresholds: Mapping[str, float] = field(default_factory=dict)
+
+    def __post_init__(self):
+        unknown = set(self.thresholds) - set(LABELS)
+        if unknown:
+            raise ValueError(f"Unknown labels in policy: {sorted(unknown)}; expected {LABELS}")
+
+    def threshold(self, label: str) -> float:
+        return float(self.thresholds.get(label, self.default))
+
+    @property
+    def version(self) -> str:
+        """Short digest of the effective thresholds, for logs and lineage."""
+        spec = json.dumps({lab: self.threshold(lab) for lab in LABELS}, sort_keys=True)
+        return hashlib.sha256(spec.encode("utf-8")).hexdigest()[:12]
+
+    def is_flagged(self, labels: Mapping[str, float]) -> bool:
+        """Decision for one {label: score} dict (missing labels score 0)."""
+        return any(float(labels.get(lab, 0.0)) >= self.threshold(lab) for lab in LABELS)
+
+    def flags(self, scores: pd.DataFrame) -> np.ndarray:
+        """Vectorized decision for a frame with one column per label."""
+        cols = [lab for lab in LABELS if lab in scores.columns]
+        if not cols:
+            return np.zeros(len(scores), dtype=bool)
+        limits = np.array([self.threshold(lab) for lab in cols])
+        return (scores[cols].to_numpy(dtype=float) >= limits).any(axis=1)
+
+    def sql_condition(self, column: str = "labels_json") -> tuple[str, list]:
+        """SQL expression (+ params) that is true when a JSON labels column is flagged."""
+        parts, params = [], []
+        for lab in LABELS:
+            parts.append(f"COALESCE(json_extract({column}, ?), 0) >= ?")
+            params += [f"$.{lab}", self.threshold(lab)]
+        return "(" + " OR ".join(parts) + ")", params
+
+
+def _parse_thresholds(spec: str) -> dict[str, float]:
+    out = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        label, value = part.split(":")
+        out[label.strip()] = float(value)
+    return out
+
+
+def load_policy(path: str | Path | None = None) -> Policy:
+    """Build the policy from `path` (JSON) or the environment (see above)."""
+    path = path or os.getenv("MOD_POLICY_FILE")
+    if path:
+        cfg = json.loads(Path(path).read_text())
+        return Policy(
+            default=float(cfg.get("default", DEFAULT_THRESHOLD)),
+            thresholds={k: float(v) for k, v in cfg.get("thresholds", {}).items()},
+        )
+    return Policy(
+        default=float(os.getenv("MOD_THRESHOLD", DEFAULT_THRESHOLD)),
+        thresholds=_parse_thresholds(os.getenv("MOD_THRESHOLDS", "")),
+    )
+
+
+_policy: Policy | None = None
+
+
+def current_policy() -> Policy:
+    """Process-wide policy, loaded from config on first use."""
+    global _policy
+    if _policy is None:
+        _policy = load_policy()
+        log.info("decision policy %s: %s", _policy.version, _policy)
+    return _policy
+
+
+def set_policy(policy: Policy | None) -> None:
+    """Replace the process-wide policy (None = reload from config on next use)."""
+    global _policy
+    _policy = policy
+
+
+def reapply_frame(df: pd.DataFrame, policy: Policy | None = None) -> pd.DataFrame:
+    """Recompute `flagged` in place from the label columns."""
+    df["flagged"] = (policy or current_policy()).flags(df)
+    return df
+
+
+def reapply_parquet(paths: Iterable[str | Path], policy: Policy | None = None) -> dict:
+    """
+    Rewrite `flagged` in scored Parquet files from their label columns with
+    Arrow compute (no pandas round trip, other columns untouched). Each file
+    is written next to the original and moved into place. Directories are
+    searched recursively for *.parquet. Returns file/row/change counts.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    policy = policy or current_policy()
+    files: list[Path] = []
+    for p in map(Path, paths):
+        files += sorted(p.rglob("*.parquet")) if p.is_dir() else [p]
+
+    totals = {"files": 0, "rows": 0, "changed": 0}
+    for path in files:
+        table = pq.ParquetFile(path).read()  # no hive partition columns from the path
+        labels = [lab for lab in LABELS if lab in table.column_names]
+        if not labels:
+            log.warning("skipping %s: no label columns", path)
+            continue
+        flagged = pc.greater_equal(table[labels[0]], policy.threshold(labels[0]))
+        for lab in labels[1:]:
+            flagged = pc.or_(flagged, pc.greater_equal(table[lab], policy.threshold(lab)))
+        flagged = pc.fill_null(flagged, False)
+
+        if "flagged" in table.column_names:
+            old = pc.fill_null(table["flagged"].cast(pa.bool_()), False)
+            changed = pc.sum(pc.not_equal(old, flagged)).as_py() or 0
+            table = table.set_column(table.column_names.index("flagged"), "flagged", flagged)
+        else:
+            changed = len(table)
+            table = table.append_column("flagged", flagged)
+
+        if changed:
+            tmp = path.with_name(path.name + ".tmp")
+            pq.write_table(table, tmp)
+            tmp.replace(path)
+        totals["files"] += 1
+        totals["rows"] += len(table)
+        totals["changed"] += changed
+    log.info("policy %s applied to Parquet: %s", policy.version, totals)
+    return totals
+
+
+def reapply_cache(policy: Policy | None = None) -> int:
+    """Recompute `flagged` for every cached result in one SQL pass; returns rows changed."""
+    from . import cache as result_cache
+
+    policy = policy or current_policy()
+    changed = result_cache.reflag(*policy.sql_condition())
+    log.info("policy %s applied to the result cache: %d flags changed", policy.version, changed)
+    return changed
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Re-apply the decision policy to stored scores (no model calls)"
+    )
+    parser.add_argument("--policy", help="Policy JSON (default: MOD_POLICY_FILE / env)")
+    parser.add_argument("--parquet", nargs="*", default=[], help="Scored Parquet files or dirs")
+    parser.add_argument("--cache", action="store_true", help="Also update the API result cache")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    pol = load_policy(args.policy)
+    if args.parquet:
+        print(reapply_parquet(args.parquet, pol))
+    if args.cache:
+        print({"cache_changed": reapply_cache(pol)})
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+from functools import cached_property
+from pathlib import Path
+
+import numpy as np
+
+from .policy import current_policy
+
+# Optional cascade in front of the transformer. A hashing vectorizer + linear
+# model, distilled from the transformer's own decisions on scored data,
+# estimates P(flagged); texts below its benign band (and empty texts) are
+# answered without running the transformer, everything else is routed to
+# it. Off unless MOD_PREFILTER=1 and a trained model exists at
+# MOD_PREFILTER_PATH. Needs scikit-learn (part of the API requirements).
+#
+#   python -m moderation.prefilter train data/scored --out .data/prefilter.joblib
+
+ENABLED = os.getenv("MOD_PREFILTER", "0") == "1"
+MODEL_PATH = Path(os.getenv("MOD_PREFILTER_PATH", ".data/prefilter.joblib"))
+# Default band for training; a trained model keeps its own band unless
+# MOD_PREFILTER_BENIGN_BELOW is set explicitly
+BENIGN_BELOW = 0.05
+_BENIGN_BELOW_ENV = os.getenv("MOD_PREFILTER_BENIGN_BELOW")
+BENIGN_BELOW_OVERRIDE = float(_BENIGN_BELOW_ENV) if _BENIGN_BELOW_ENV else None
+
+# Routes returned by PreFilter.route
+EMPTY, BENIGN, MODEL = 0, 1, 2
+ROUTE_NAMES = ("empty", "benign", "model")
+
+log = logging.getLogger(__name__)
+
+
+class PreFilter:
+    """Cheap P(flagged) estimator that decides which texts need the transformer."""
+
+    def __init__(self, benign_below: float = BENIGN_BELOW, n_features: int = 2**18):
+        from sklearn.feature_extraction.text import HashingVectorizer
+        from sklearn.linear_model import LogisticRegression
+
+        self.benign_below = float(benign_below)
+        # Character n-grams cope with obfuscated spellings ("id10t") and emoji
+        self.vectorizer = HashingVectorizer(
+            analyzer="char_wb",
+            ngram_range=(2, 4),
+            n_features=n_features,
+            alternate_sign=False,
+        )
+        # Balanced weights push probabilities up for the rare flagged class,
+        # so mistakes lean towards sending text to the transformer
+        self.model = LogisticRegression(max_iter=1000, class_weight="balanced")
+
+    def fit(self, texts: list[str], flagged) -> PreFilter:
+        y = np.asarray(flagged, dtype=bool)
+        if y.all() or not y.any():
+            raise ValueError("training data needs both flagged and benign examples")
+        self.model.fit(self.vectorizer.transform(texts), y)
+        self.__dict__.pop("version", None)
+        return self
+
+    def toxic_proba(self, texts: list[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros(0)
+        return self.model.predict_proba(self.vectorizer.transform(texts))[:, 1]
+
+    def route(self, texts: list[str]) -> tuple[np.ndarray, np.ndarray]:
+        """(route per text: EMPTY/BENIGN/MODEL, estimated P(flagged) per text)."""
+        routes = np.full(len(texts), MODEL, dtype=np.int8)
+        proba = np.zeros(len(texts))
+        empty = np.fromiter((not t.strip() for t in texts), dtype=bool, count=len(texts))
+        routes[empty] = EMPTY
+        rest = np.flatnonzero(~empty)
+        if len(rest):
+            p = self.toxic_proba([texts[i] for i in rest])
+            proba[rest] = p
+            routes[rest[p < self.benign_below]] = BENIGN
+        return routes, proba
+
+    @cached_property
+    def version(self) -> str:
+        """Digest of the weights and band; part of the result-cache key when enabled."""
+        h = hashlib.sha256(np.ascontiguousarray(self.model.coef_).tobytes())
+        h.update(f"{self.model.intercept_[0]!r}|{self.benign_below!r}".encode())
+        return h.hexdigest()[:12]
+
+    def save(self, path: str | Path) -> Path:
+        import joblib
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        joblib.dump(self, path)
+        return path
+
+    @classmethod
+    def load(cls, path: str | Path, benign_below: float | None = None) -> PreFilter:
+        import joblib
+
+        pf = joblib.load(path)
+        if not isinstance(pf, cls):
+            raise TypeError(f"{path} does not contain a {cls.__name__}")
+        if benign_below is not None:
+            pf.benign_below = float(benign_below)
+            pf.__dict__.pop("version", None)
+        return pf
+
+
+_prefilter: PreFilter | None = None
+_loaded = False
+
+
+def get_prefilter() -> PreFilter | None:
+    """The configured pre-filter, or None when disabled or not trained yet."""
+    global _prefilter, _loaded
+    if not _loaded:
+        _loaded = True
+        if ENABLED:
+            if MODEL_PATH.exists():
+                _prefilter = PreFilter.load(MODEL_PATH, BENIGN_BELOW_OVERRIDE)
+                log.info(
+                    "pre-filter %s loaded from %s (benign below %s)",
+                    _prefilter.version,
+                    MODEL_PATH,
+                    _prefilter.benign_below,
+                )
+                if _prefilter.benign_below >= current_policy().threshold("toxic"):
+                    log.warning(
+                        "pre-filter band %s is not below the toxic threshold; "
+                        "texts may be flagged on the pre-filter estimate alone",
+                        _prefilter.benign_below,
+                    )
+            else:
+                log.warning("MOD_PREFILTER=1 but %s does not exist; pre-filter off", MODEL_PATH)
+    return _prefilter
+
+
+def set_prefilter(prefilter: PreFilter | None) -> None:
+    """Install (or remove, with None) the process-wide pre-filter."""
+    global _prefilter, _loaded
+    _prefilter, _loaded = prefilter, True
+
+
+def train_from_scored(paths, out: str | Path = MODEL_PATH, benign_below: float = BENIGN_BELOW):
+    """Fit on scored Parquet files/dirs (clean_text + flagged) and save to `out`."""
+    import pandas as pd
+
+    files: list[Path] = []
+    for p in map(Path, paths):
+        files += sorted(p.rglob("*.parquet")) if p.is_dir() else [p]
+    df = pd.concat(
+        [pd.read_parquet(f, columns=["clean_text", "flagged"]) for f in files], ignore_index=True
+    ).drop_duplicates("clean_text")
+    pf = PreFilter(benign_below).fit(df["clean_text"].fillna("").tolist(), df["flagged"])
+
+    routes, _ = pf.route(df["clean_text"].fillna("").tolist())
+    skipped = routes != MODEL
+    missed = int((skipped & df["flagged"].to_numpy(dtype=bool)).sum())
+    log.info(
+        "trained on %d texts: %.1f%% would skip the model, %d flagged texts among them",
+        len(df),
+        100 * skipped.mean(),
+        missed,
+    )
+    return pf.save(out)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Train the pre-filter on scored Parquet")
+    parser.add_argument("command", choices=["train"])
+    parser.add_argument("scored", nargs="+", help="Scored Parquet files or directories")
+    parser.add_argument("--out", default=str(MODEL_PATH))
+    parser.add_argument("--benign-below", type=float, default=BENIGN_BELOW)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    print(f"Wrote {train_from_scored(args.scored, args.out, args.benign_below)}")
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import sqlite3
+import time
+from collections.abc import Iterable
+from pathlib import Path
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS processed (
+        fingerprint TEXT PRIMARY KEY,
+        name TEXT,
+        processed_at REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS processed_at_idx ON processed(processed_at)",
+    # stat signature -> content fingerprint, so unchanged files are not re-read
+    """
+    CREATE TABLE IF NOT EXISTS stat_cache (
+        stat_key TEXT PRIMARY KEY,
+        fingerprint TEXT NOT NULL,
+        seen_at REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS stat_cache_seen_idx ON stat_cache(seen_at)",
+)
+
+# Stay below SQLite's bound-parameter limit on older builds
+_MAX_VARS = 900
+
+
+class ProcessedIndex:
+    """
+    Set of processed file fingerprints, stored in SQLite.
+
+    Membership checks are indexed lookups (bulk via `filter_unprocessed`),
+    `mark_many` writes in one transaction, and `prune` drops entries older
+    than a retention window.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._con = sqlite3.connect(self.path, timeout=30.0)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        with self._con:
+            for stmt in _SCHEMA:
+                self._con.execute(stmt)
+            cols = {row[1] for row in self._con.execute("PRAGMA table_info(processed)")}
+            if "sample" not in cols:
+                # Cheap head/tail digest of large files, used as a pre-filter
+                self._con.execute("ALTER TABLE processed ADD COLUMN sample TEXT")
+            self._con.execute(
+                "CREATE INDEX IF NOT EXISTS processed_sample_idx ON processed(sample)"
+            )
+
+    def __len__(self) -> int:
+        return self._con.execute("SELECT COUNT(*) FROM processed").fetchone()[0]
+
+    def __contains__(self, fingerprint: str) -> bool:
+        row = self._con.execute(
+            "SELECT 1 FROM processed WHERE fingerprint=?", (fingerprint,)
+        ).fetchone()
+        return row is not None
+
+    def _select_in(self, sql: str, values: Iterable[str]) -> list[tuple]:
+        # `sql` has a single "{marks}" placeholder for the IN (...) list
+        vals = list(dict.fromkeys(values))
+        rows: list[tuple] = []
+        for i in range(0, len(vals), _MAX_VARS):
+            chunk = vals[i : i + _MAX_VARS]
+            marks = ",".join("?" * len(chunk))
+            rows.extend(self._con.execute(sql.format(marks=marks), chunk))
+        return rows
+
+    def known(self, fingerprints: Iterable[str]) -> set[str]:
+        """Return the subset of `fingerprints` already in the index."""
+        sql = "SELECT fingerprint FROM processed WHERE fingerprint IN ({marks})"
+        return {fp for (fp,) in self._select_in(sql, fingerprints)}
+
+    def known_samples(self, samples: Iterable[str]) -> set[str]:
+        """Return the subset of `samples` recorded for some processed file."""
+        sql = "SELECT DISTINCT sample FROM processed WHERE sample IN ({marks})"
+        return {s for (s,) in self._select_in(sql, samples)}
+
+    def cached_fingerprints(self, stat_keys: Iterable[str]) -> dict[str, str]:
+        """Look up content fingerprints previously computed for these stat keys."""
+        sql = "SELECT stat_key, fingerprint FROM stat_cache WHERE stat_key IN ({marks})"
+        return dict(self._select_in(sql, stat_keys))
+
+    def remember_fingerprints(self, pairs: Iterable[tuple[str, str]], now: float | None = None):
+        """Store (stat_key, fingerprint) pairs for the stat pre-check."""
+        ts = time.time() if now is None else now
+        with self._con:
+            self._con.executemany(
+                "INSERT OR REPLACE INTO stat_cache(stat_key, fingerprint, seen_at) VALUES(?,?,?)",
+                [(key, fp, ts) for key, fp in pairs],
+            )
+
+    def filter_unprocessed(self, fingerprints: Iterable[str]) -> list[str]:
+        fps = list(fingerprints)
+        known = self.known(fps)
+        return [fp for fp in fps if fp not in known]
+
+    def mark_many(
+        self,
+        entries: Iterable[tuple[str, str | None] | tuple[str, str | None, str | None]],
+        now: float | None = None,
+    ):
+        """Record (fingerprint, name[, sample]) tuples as processed, atomically."""
+        ts = time.time() if now is None else now
+        rows = []
+        for entry in entries:
+            fp, name, sample = (*entry, None)[:3]
+            rows.append((fp, name, ts, sample))
+        with self._con:
+            self._con.executemany(
+                "INSERT OR REPLACE INTO processed(fingerprint, name, processed_at, sample) "
+                "VALUES(?,?,?,?)",
+                rows,
+            )
+
+    def prune(self, max_age_s: float, now: float | None = None) -> int:
+        """Delete entries processed more than `max_age_s` ago; returns the count."""
+        cutoff = (time.time() if now is None else now) - max_age_s
+        with self._con:
+            cur = self._con.execute("DELETE FROM processed WHERE processed_at < ?", (cutoff,))
+            self._con.execute("DELETE FROM stat_cache WHERE seen_at < ?", (cutoff,))
+        return cur.rowcount
+
+    def close(self) -> None:
+        self._con.close()
@@ -1,70 +1,194 @@
-import hashlib
+import asyncio
 import logging
+import os
+import threading
 import time
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
+from moderation.batching import MicroBatcher, QueueFullError
 from moderation.cache import get as cache_get
+from moderation.cache import get_many as cache_get_many
 from moderation.cache import put as cache_put
-from moderation.metrics import meter
-from moderation.pipeline import MODEL_VERSION, MULTI_LABELS, score_multilabel
+from moderation.cache import put_many as cache_put_many
+from moderation.cache import stats as cache_stats
+from moderation.cleaning import basic_clean
+from moderation.metrics import Exposition, meter, process_stats
+from moderation.pipeline import (
+    LENGTH_BUCKETS,
+    cache_key,
+    get_toxicity_model,
+    score_multilabel,
+    to_cache_values,
+)
+from moderation.policy import current_policy
+from moderation.prefilter import get_prefilter
 from pydantic import BaseModel
 
 logging.basicConfig(level=logging.INFO)
 
+# Load the model and run a warmup pass at startup, in the background; /ready
+# reports 503 until it is done. With MOD_WARMUP=0 the model loads on first use.
+WARMUP = os.getenv("MOD_WARMUP", "1") == "1"
+# Failed warmups (e.g. a transient hub/network error) are retried with
+# exponential backoff; once the retries are used up /health fails too, so the
+# orchestrator restarts the process instead of leaving it unready forever
+WARMUP_RETRIES = int(os.getenv("MOD_WARMUP_RETRIES", "5"))
+WARMUP_BACKOFF_S = float(os.getenv("MOD_WARMUP_BACKOFF_S", "2"))
 
-app = FastAPI(title="Moderation API", version="0.1.0")
+
+def _warmup_texts(buckets: list[tuple[int, int]]) -> list[str]:
+    """One text per length bucket, filling it to its token limit."""
+    # "ok" is one token; the model adds [CLS] and [SEP]
+    return [" ".join(["ok"] * max(max_len - 2, 1)) for max_len, _ in buckets]
+
+
+# Every length bucket's batch shape gets run (and its kernels/allocations hit) once
+WARMUP_TEXTS = _warmup_texts(LENGTH_BUCKETS)
+
+_ready = threading.Event()
+_warmup_error: str | None = None
+
+
+def _warm_up() -> None:
+    global _warmup_error
+    for attempt in range(WARMUP_RETRIES + 1):
+        try:
+            get_toxicity_model()  # records model_load_seconds
+            get_prefilter()
+            t0 = time.perf_counter()
+            score_multilabel(WARMUP_TEXTS, use_prefilter=False)
+            meter.set_gauge("model_warmup_seconds", time.perf_counter() - t0)
+            break
+        except Exception as exc:
+            if attempt == WARMUP_RETRIES:
+                logging.exception("model warmup failed after %d attempts", attempt + 1)
+                _warmup_error = repr(exc)
+                return
+            delay = WARMUP_BACKOFF_S * 2**attempt
+            logging.warning("model warmup failed (%r), retrying in %.0fs", exc, delay)
+            time.sleep(delay)
+    meter.set_gauge("model_ready", 1)
+    _ready.set()
+    logging.info("model warm, ready to serve")
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    if WARMUP:
+        meter.set_gauge("model_ready", 0)
+        threading.Thread(target=_warm_up, name="model-warmup", daemon=True).start()
+    else:
+        _ready.set()
+    yield
+
+
+app = FastAPI(title="Moderation API", version="0.1.0", lifespan=lifespan)
+
+# Micro-batching: concurrent cache misses are coalesced into one model call
+BATCH_MAX_SIZE = int(os.getenv("MOD_BATCH_MAX_SIZE", "32"))
+BATCH_MAX_WAIT_MS = float(os.getenv("MOD_BATCH_MAX_WAIT_MS", "5"))
+# Upper bound on texts per POST /moderate/batch request
+BATCH_MAX_ITEMS = int(os.getenv("MOD_BATCH_MAX_ITEMS", "1000"))
+# Inference executor: dedicated worker threads and max texts waiting for them.
+# When the queue is full requests fail fast with 503 instead of piling up.
+INFER_WORKERS = int(os.getenv("MOD_INFER_WORKERS", "1"))
+INFER_MAX_QUEUE = int(os.getenv("MOD_INFER_MAX_QUEUE", "2048"))
+
+
+def _score_batch(texts: list[str]) -> list[dict]:
+    return to_cache_values(score_multilabel(texts))
+
+
+batcher = MicroBatcher(
+    _score_batch,
+    max_batch_size=BATCH_MAX_SIZE,
+    max_wait_ms=BATCH_MAX_WAIT_MS,
+    workers=INFER_WORKERS,
+    max_queue=INFER_MAX_QUEUE,
+    name="inference",
+)
 
 
 class ModerationIn(BaseModel):
     text: str
 
 
-def _moderate(text: str):
+class BatchItemIn(BaseModel):
+    id: str | int | None = None  # echoed back unchanged
+    text: str
+
+
+class ModerationBatchIn(BaseModel):
+    items: list[BatchItemIn]
+
+
+def _response(value: dict, cached: bool) -> dict:
+    # `flagged` comes from the current policy, not the value stored with the
+    # scores, so threshold changes apply to cached results too
+    return {
+        "flagged": current_policy().is_flagged(value["labels"]),
+        "score": float(value["score"]),
+        "labels": {k: float(v) for k, v in value["labels"].items()},
+        "cached": cached,
+    }
+
+
+async def _infer(texts: list[str]) -> list[dict]:
+    """Score texts on the inference workers without blocking the event loop."""
+    try:
+        futs = batcher.submit_many(texts)
+    except QueueFullError:
+        raise HTTPException(
+            status_code=503, detail="inference queue is full", headers={"Retry-After": "1"}
+        ) from None
+    return await asyncio.gather(*(asyncio.wrap_future(f) for f in futs))
+
+
+# NOTE: cache calls stay on the event loop - memory hits are a dict lookup and
+# SQLite reads are sub-millisecond point lookups. Writes only touch the
+# in-memory buffer; the cache's flusher thread does the SQLite writes.
+async def _moderate(text: str):
     t0 = time.perf_counter()
 
-    # 1) validate & normalize
-    t = (text or "").strip()
+    # 1) normalize & validate - the same cleaning as the batch pipeline, so
+    # both key and score the same text and share cache entries. Input that is
+    # only markup/URLs cleans to "" and is rejected like empty text
+    t = basic_clean(text)
     if not t:
         raise HTTPException(status_code=400, detail="text is required")
 
-    # 2) build deterministic cache key (text + model version)
-    key = f"{t}|{MODEL_VERSION}"
-    h = hashlib.sha256(key.encode("utf-8")).hexdigest()
+    # 2) build deterministic cache key (text + model version), shared with batch jobs
+    h = cache_key(t)
 
     # 3) cache lookup
-    cached = cache_get(h)
+    with meter.time_stage("cache_lookup"):
+        cached = cache_get(h)
     if cached:
+        resp = _response(cached, cached=True)
         latency_ms = (time.perf_counter() - t0) * 1000.0
-        meter.inc(cache_hit=True, flagged=bool(cached["flagged"]), latency_ms=latency_ms)
+        meter.inc(cache_hit=True, flagged=resp["flagged"], latency_ms=latency_ms)
         logging.info(
             "moderate",
             extra={
                 "route": "/moderate",
                 "cached": True,
-                "flagged": bool(cached["flagged"]),
+                "flagged": resp["flagged"],
                 "latency_ms": latency_ms,
                 "text_len": len(t),
             },
         )
-        return {
-            "flagged": bool(cached["flagged"]),
-            "score": float(cached["score"]),
-            "labels": {k: float(v) for k, v in cached["labels"].items()},
-            "cached": True,
-        }
-
-    # 4) compute fresh
-    df = score_multilabel([t])  # 1-row DataFrame
-    labels = {k: float(df.loc[0, k]) for k in MULTI_LABELS}
-    resp = {
-        "flagged": bool(df.loc[0, "flagged"]),
-        "score": float(df.loc[0, "toxic"]),
-        "labels": labels,
-        "cached": False,
-    }
+        return resp
+
+    # 4) compute fresh (batched with other in-flight misses)
+    with meter.time_stage("inference"):
+        (value,) = await _infer([t])
+    resp = _response(value, cached=False)
 
     # 5) write-through cache
-    cache_put(h, resp["score"], resp["flagged"], labels)
+    with meter.time_stage("cache_write"):
+        cache_put(h, value["score"], value["flagged"], value["labels"])
 
     # 6) metrics + log
     latency_ms = (time.perf_counter() - t0) * 1000.0
@@ -83,21 +207,161 @@ def _moderate(text: str):
     return resp
 
 
+async def _moderate_batch(items: list[BatchItemIn]):
+    t0 = time.perf_counter()
+
+    # 1) validate & normalize
+    if not items:
+        raise HTTPException(status_code=400, detail="items is required")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"at most {BATCH_MAX_ITEMS} items per batch")
+    texts = [basic_clean(it.text) for it in items]
+    empty = [i for i, t in enumerate(texts) if not t]
+    if empty:
+        raise HTTPException(status_code=400, detail=f"text is required (items {empty[:10]})")
+
+    # 2) one bulk cache lookup for every key
+    keys = [cache_key(t) for t in texts]
+    with meter.time_stage("cache_lookup"):
+        cached = cache_get_many(keys)
+
+    # 3) score the (unique) misses on the inference workers, write back in one batch
+    misses = {h: t for h, t in zip(keys, texts, strict=True) if h not in cached}
+    fresh: dict[str, dict] = {}
+    if misses:
+        with meter.time_stage("inference"):
+            fresh = dict(zip(misses, await _infer(list(misses.values())), strict=True))
+        with meter.time_stage("cache_write"):
+            cache_put_many((h, v["score"], v["flagged"], v["labels"]) for h, v in fresh.items())
+
+    # 4) responses in request order
+    results = []
+    for item, h in zip(items, keys, strict=True):
+        hit = h in cached
+        results.append({"id": item.id, **_response(cached[h] if hit else fresh[h], cached=hit)})
+
+    # 5) metrics + log (latency amortized over the batch)
+    latency_ms = (time.perf_counter() - t0) * 1000.0
+    for r in results:
+        meter.inc(cache_hit=r["cached"], flagged=r["flagged"], latency_ms=latency_ms / len(results))
+    logging.info(
+        "moderate_batch",
+        extra={
+            "route": "/moderate/batch",
+            "items": len(results),
+            "scored": len(fresh),
+            "latency_ms": latency_ms,
+        },
+    )
+
+    return {"results": results}
+
+
 @app.get("/health")
-def health():
+async def health():
+    """
+    Liveness: the process is up (the model may still be loading, see /ready).
+    503 once warmup has failed for good, so the process gets restarted.
+    """
+    if _warmup_error:
+        return JSONResponse({"status": "failed", "error": _warmup_error}, status_code=503)
     return {"status": "ok"}
 
 
+@app.get("/ready")
+async def ready():
+    """Readiness: 200 once the model is loaded and warmed up, 503 before that."""
+    if _ready.is_set():
+        return {"status": "ready"}
+    status = "failed" if _warmup_error else "loading"
+    return JSONResponse({"status": status, "error": _warmup_error}, status_code=503)
+
+
 @app.get("/moderate")
-def moderate_get(text: str):
-    return _moderate(text)
+async def moderate_get(text: str):
+    return await _moderate(text)
 
 
 @app.post("/moderate")
-def moderate_post(payload: ModerationIn):
-    return _moderate(payload.text)
+async def moderate_post(payload: ModerationIn):
+    return await _moderate(payload.text)
+
+
+@app.post("/moderate/batch")
+async def moderate_batch(payload: ModerationBatchIn):
+    return await _moderate_batch(payload.items)
+
+
+def _size_buckets(size_counts: list[int]) -> list[tuple[int, int]]:
+    # Cumulative batch counts at powers of two up to max_batch_size
+    buckets, running = [], 0
+    for n, count in enumerate(size_counts):
+        running += count
+        if n and (n & (n - 1) == 0 or n == len(size_counts) - 1):
+            buckets.append((n, running))
+    return buckets
+
+
+def _prometheus_metrics() -> str:
+    out = Exposition()
+    meter.expose(out)
+
+    b = batcher.stats()
+    out.add(
+        "inference_queue_depth", "gauge", "Texts waiting for an inference worker.", batcher.depth
+    )
+    out.add("inference_batches_total", "counter", "Model batches run.", b["batches"])
+    out.add("inference_items_total", "counter", "Texts scored by the model.", b["items"])
+    out.histogram(
+        "inference_batch_size",
+        "Texts per model batch.",
+        [({}, _size_buckets(b["size_counts"]), b["items"], b["batches"])],
+    )
+    out.latency_histogram(
+        "inference_batch_duration_seconds", "Model time per batch.", [({}, b["duration_ms"])]
+    )
+
+    tiers = cache_stats()
+    out.add(
+        "result_cache_lookups_total",
+        "counter",
+        "Result cache lookups by tier and outcome.",
+        [
+            ({"tier": tier, "result": result}, s[key])
+            for tier, s in tiers.items()
+            for result, key in (("hit", "hits"), ("miss", "misses"))
+        ],
+    )
+    out.add(
+        "result_cache_evictions_total",
+        "counter",
+        "Entries evicted from a cache tier.",
+        [({"tier": tier}, s["evictions"]) for tier, s in tiers.items()],
+    )
+    mem = tiers["memory"]
+    out.add("result_cache_memory_entries", "gauge", "Entries in the memory tier.", mem["entries"])
+    out.add("result_cache_memory_bytes", "gauge", "Approx. bytes in the memory tier.", mem["bytes"])
+
+    proc = process_stats()
+    for name, kind, help_text in (
+        ("resident_memory_bytes", "gauge", "Resident memory size in bytes."),
+        ("cpu_seconds_total", "counter", "User and system CPU time in seconds."),
+        ("start_time_seconds", "gauge", "Start time since the epoch in seconds."),
+    ):
+        out.add(f"process_{name}", kind, help_text, proc[name])
+    return out.render()
 
 
 @app.get("/metrics")
-def metrics():
-    return meter.snapshot()
+async def metrics():
+    """Prometheus text exposition (JSON summary at /metrics.json)."""
+    return PlainTextResponse(_prometheus_metrics(), media_type=Exposition.CONTENT_TYPE)
+
+
+@app.get("/metrics.json")
+async def metrics_json():
+    return {
+        **meter.snapshot(),
+        "inference_queue_depth": batcher.depth,
+        "cache": cache_stats(),
+    }
@@ -0,0 +1,62 @@
+"""
+Gunicorn settings for serving with several worker processes.
+
+    gunicorn -c src/service/gunicorn_conf.py service.app:app
+
+The app is imported and the model loaded once in the master; workers are
+forked from it and share the weights copy-on-write instead of each loading
+its own copy. Nothing that owns threads or file handles is started before
+the fork: the inference batcher, cache connections and warmup pass are all
+created lazily inside each worker.
+
+MOD_PRELOAD=0 restores one model per worker (for comparison, see
+scripts/bench_worker_memory.py). Only the torch backend is preloaded: ONNX
+Runtime sessions own thread pools that do not survive a fork.
+
+Metrics, batcher and cache stats and /ready are per worker process, and a
+request reaches whichever worker accepts it. With MOD_WEB_WORKERS > 1 a
+Prometheus scrape of /metrics sees a different worker each time, so
+counters look like they reset. The default is one worker; run more only
+behind a scraper that can tell them apart, or scale out with more
+single-worker containers instead.
+"""
+
+import gc
+import logging
+import os
+
+bind = os.getenv("MOD_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("MOD_WEB_WORKERS", "1"))
+worker_class = "uvicorn_worker.UvicornWorker"
+# Model load + warmup can take a while on a cold node
+timeout = int(os.getenv("MOD_WORKER_TIMEOUT", "120"))
+
+PRELOAD = os.getenv("MOD_PRELOAD", "1") == "1"
+preload_app = PRELOAD
+
+log = logging.getLogger("gunicorn.error")
+
+
+def when_ready(server):
+    # Runs in the master after the app import, before the first fork
+    if not PRELOAD:
+        return
+    from moderation.backends import BACKEND
+    from moderation.pipeline import get_toxicity_model
+
+    if BACKEND != "torch":
+        log.info("Not preloading the %s backend; workers load their own", BACKEND)
+        return
+    get_toxicity_model()
+    # Keep the collector from writing to (and so copying) the shared objects
+    gc.freeze()
+    log.info("Model loaded in master; forking %d workers", workers)
+
+
+def post_fork(server, worker):
+    # Split cores between workers instead of every worker using all of them
+    threads = os.getenv("MOD_TORCH_THREADS")
+    if threads:
+        import torch
+
+        torch.set_num_threads(int(threads))
@@ -0,0 +1,66 @@
+import uuid
+
+from fastapi.testclient import TestClient
+from service.app import app
+
+client = TestClient(app)
+
+
+def test_batch_moderate_preserves_order_and_uses_cache():
+    run = uuid.uuid4().hex
+    seen = f"batch text seen before {run}"
+    new = f"batch text never seen {run}"
+
+    r0 = client.post("/moderate", json={"text": seen})
+    assert r0.status_code == 200, r0.text
+
+    payload = {
+        "items": [
+            {"id": "a", "text": new},
+            {"id": "b", "text": seen},
+            {"text": f"  {new}  "},  # same key after normalization
+        ]
+    }
+    r = client.post("/moderate/batch", json=payload)
+    assert r.status_code == 200, r.text
+    results = r.json()["results"]
+
+    assert [x["id"] for x in results] == ["a", "b", None]
+    assert [x["cached"] for x in results] == [False, True, False]
+    assert results[1]["labels"] == r0.json()["labels"]
+    assert results[0]["labels"] == results[2]["labels"]
+
+
+def test_batch_moderate_echoes_numeric_and_string_ids():
+    items = [{"id": 1, "text": "first"}, {"id": "1", "text": "second"}, {"text": "third"}]
+    r = client.post("/moderate/batch", json={"items": items})
+    assert r.status_code == 200, r.text
+    assert [x["id"] for x in r.json()["results"]] == [1, "1", None]
+
+
+def test_batch_moderate_rejects_empty_text():
+    r = client.post("/moderate/batch", json={"items": [{"text": "ok"}, {"text": "   "}]})
+    assert r.status_code == 400
+
+    # Only a URL / markup: empty once cleaned, so rejected rather than scored as ""
+    items = [{"text": "ok"}, {"text": "http://only.a.url"}, {"text": "<br/>"}]
+    r = client.post("/moderate/batch", json={"items": items})
+    assert r.status_code == 400
+    assert "[1, 2]" in r.json()["detail"]
+    assert client.post("/moderate", json={"text": "http://only.a.url"}).status_code == 400
+
+
+def test_full_inference_queue_returns_503(monkeypatch):
+    import service.app as app_mod
+    from moderation.batching import QueueFullError
+
+    class FullBatcher:
+        depth = 0
+
+        def submit_many(self, items):
+            raise QueueFullError("full")
+
+    monkeypatch.setattr(app_mod, "batcher", FullBatcher())
+    r = client.post("/moderate", json={"text": f"overloaded {uuid.uuid4().hex}"})
+    assert r.status_code == 503
+    assert r.headers["retry-after"] == "1"
@@ -21,3 +21,28 @@ def test_idempotent_moderate():
     # score/labels identical
     assert data1["score"] == data2["score"]
     assert data1["labels"] == data2["labels"]
+
+
+def test_api_and_batch_share_cache_entries(tmp_path, monkeypatch):
+    import pandas as pd
+
+    from moderation import cache as mc
+    from moderation import pipeline
+    from moderation.pipeline import attach_scores, clean
+
+    monkeypatch.setattr(mc, "DB_PATH", tmp_path / "mod_cache.db")
+    raw = "You are <b>GREAT</b>  , see https://example.com/x"
+
+    r = client.post("/moderate", json={"text": raw})
+    assert r.status_code == 200 and r.json()["cached"] is False
+    # Cleaned on the way in, so a differently formatted copy is a cache hit
+    assert client.post("/moderate", json={"text": "you are great, see"}).json()["cached"]
+
+    # The batch pipeline finds the same entry without calling the model
+    class NoModel:
+        def __call__(self, *args, **kwargs):
+            raise AssertionError("model called for a cached text")
+
+    monkeypatch.setattr(pipeline, "_toxicity_model", NoModel())
+    scored = attach_scores(clean(pd.DataFrame({"text": [raw]})))
+    assert scored.loc[0, "toxicity_score"] == r.json()["score"]
@@ -0,0 +1,101 @@
+import time
+
+from fastapi.testclient import TestClient
+from service import app as service
+
+
+def test_ready_is_503_until_warm_then_200(monkeypatch):
+    monkeypatch.setattr(service, "_ready", service.threading.Event())
+    monkeypatch.setattr(service, "WARMUP", True)
+
+    # No lifespan run: the model has not been warmed
+    cold = TestClient(service.app)
+    assert cold.get("/health").status_code == 200
+    r = cold.get("/ready")
+    assert r.status_code == 503
+    assert r.json()["status"] == "loading"
+
+    with TestClient(service.app) as client:
+        deadline = time.monotonic() + 10
+        while client.get("/ready").status_code != 200 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert client.get("/ready").json() == {"status": "ready"}
+
+    snap = service.meter.snapshot()
+    assert snap["model_ready"] == 1
+    assert "model_warmup_seconds" in snap
+
+
+def test_concurrent_first_calls_load_the_model_once(monkeypatch):
+    import threading
+
+    from moderation import pipeline
+
+    loads = []
+
+    def slow_load(name):
+        loads.append(threading.current_thread().name)
+        time.sleep(0.2)
+        return object()
+
+    monkeypatch.setattr(pipeline, "_toxicity_model", None)
+    monkeypatch.setattr(pipeline, "load_backend", slow_load)
+    threads = [threading.Thread(target=pipeline.get_toxicity_model) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(loads) == 1
+
+
+def test_warmup_retries_then_fails_health(monkeypatch):
+    from benchmarks.stub_model import StubModel
+    from moderation import pipeline
+
+    monkeypatch.setattr(pipeline, "_toxicity_model", StubModel(us_per_token=0))
+    attempts = []
+
+    def flaky_load():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise OSError("hub unreachable")
+
+    monkeypatch.setattr(service, "_ready", service.threading.Event())
+    monkeypatch.setattr(service, "_warmup_error", None)
+    monkeypatch.setattr(service, "WARMUP_BACKOFF_S", 0)
+    monkeypatch.setattr(service, "get_toxicity_model", flaky_load)
+    service._warm_up()
+    assert len(attempts) == 3 and service._ready.is_set()
+
+    # Out of retries: not ready, and no longer live either
+    monkeypatch.setattr(service, "_ready", service.threading.Event())
+    monkeypatch.setattr(service, "WARMUP_RETRIES", 1)
+    attempts.clear()
+
+    def broken_load():
+        attempts.append(1)
+        raise OSError("hub unreachable")
+
+    monkeypatch.setattr(service, "get_toxicity_model", broken_load)
+    service._warm_up()
+    assert len(attempts) == 2
+    client = TestClient(service.app)
+    assert client.get("/ready").json()["status"] == "failed"
+    assert client.get("/health").status_code == 503
+
+
+def test_warmup_texts_fill_every_length_bucket():
+    from moderation import pipeline
+
+    class WordTokenizer:
+        # One token per word plus [CLS]/[SEP], as "ok" tokenizes under BERT
+        def __call__(self, texts, **_):
+            return {"input_ids": [[0] * (len(t.split()) + 2) for t in texts]}
+
+    class BertLikeModel:
+        tokenizer = WordTokenizer()
+
+    buckets = [(32, 128), (64, 64), (128, 32), (256, 16), (512, 8)]
+    texts = service._warmup_texts(buckets)
+    lengths = pipeline._token_lengths(BertLikeModel(), texts)
+    assert lengths.tolist() == [max_len for max_len, _ in buckets]
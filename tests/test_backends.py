@@ -0,0 +1,33 @@
+import pytest
+from moderation.backends import OnnxTextClassifier, export_onnx, load_torch_pipeline
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("onnx")
+
+TEXTS = [
+    "I love this product!",
+    "You are stupid.",
+    "This is awful!!!!,",
+    "",
+    "neutral statement about the weather " * 40,  # exercises truncation
+]
+
+
+def _as_dicts(results):
+    return [{item["label"]: item["score"] for item in r} for r in results]
+
+
+@pytest.mark.parametrize(("quantize", "tol"), [(False, 1e-3), (True, 0.05)])
+def test_onnx_scores_match_torch(tmp_path_factory, quantize, tol):
+    out_dir = tmp_path_factory.getbasetemp() / "onnx"
+    model_path = export_onnx(out_dir, quantize=quantize)
+    onnx_model = OnnxTextClassifier(model_path.parent, model_path.name)
+
+    expected = _as_dicts(load_torch_pipeline()(TEXTS, truncation=True))
+    got = _as_dicts(onnx_model(TEXTS, truncation=True, batch_size=2))
+
+    assert len(got) == len(expected)
+    for e, g in zip(expected, got, strict=True):
+        assert e.keys() == g.keys()
+        for label in e:
+            assert g[label] == pytest.approx(e[label], abs=tol)
@@ -0,0 +1,60 @@
+import threading
+
+import pytest
+from moderation.batching import MicroBatcher, QueueFullError
+
+
+def test_concurrent_submits_are_coalesced_and_ordered():
+    batch_sizes = []
+    release = threading.Event()
+
+    def fn(items):
+        release.wait(timeout=5)
+        batch_sizes.append(len(items))
+        return [x * 10 for x in items]
+
+    b = MicroBatcher(fn, max_batch_size=8, max_wait_ms=50)
+
+    # First item occupies the worker; the rest pile up and form one batch
+    first = b.submit(0)
+    futs = [b.submit(i) for i in range(1, 9)]
+    release.set()
+
+    assert first.result(timeout=5) == 0
+    assert [f.result(timeout=5) for f in futs] == [i * 10 for i in range(1, 9)]
+    assert max(batch_sizes) == 8
+    assert sum(batch_sizes) == 9
+
+
+def test_batch_errors_propagate_to_every_caller():
+    def fn(items):
+        raise ValueError("boom")
+
+    b = MicroBatcher(fn, max_batch_size=4, max_wait_ms=1)
+    futs = [b.submit(i) for i in range(3)]
+    for f in futs:
+        with pytest.raises(ValueError, match="boom"):
+            f.result(timeout=5)
+
+
+def test_bounded_queue_rejects_when_full():
+    started = threading.Event()
+    release = threading.Event()
+
+    def fn(items):
+        started.set()
+        release.wait(timeout=5)
+        return items
+
+    b = MicroBatcher(fn, max_batch_size=1, max_wait_ms=0, max_queue=2)
+    busy = b.submit("busy")
+    assert started.wait(timeout=5)
+
+    queued = b.submit_many(["q1", "q2"])
+    assert b.depth == 2
+    with pytest.raises(QueueFullError):
+        b.submit("overflow")
+
+    release.set()
+    assert busy.result(timeout=5) == "busy"
+    assert [f.result(timeout=5) for f in queued] == ["q1", "q2"]
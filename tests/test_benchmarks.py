@@ -0,0 +1,45 @@
+import json
+
+from benchmarks import run
+
+
+def test_benchmark_suite_runs_and_diffs_against_baseline(tmp_path, capsys):
+    small = ["--rows", "300", "--cache-ops", "300", "--requests", "60", "--concurrency", "4"]
+    out = tmp_path / "bench.json"
+
+    assert run.main(["--suite", "clean", "score", "cache", "api", "--out", str(out), *small]) == 0
+    metrics = json.loads(out.read_text())["metrics"]
+    assert metrics["clean.mismatches"] == 0
+    assert metrics["score.score_multilabel.rows_per_s"] > 0
+    assert metrics["api.p99_ms"] >= metrics["api.p50_ms"]
+
+    # A baseline 10x faster than reality is reported as a regression
+    fast = {k: v * 10 if k.endswith("_per_s") else v for k, v in metrics.items()}
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(json.dumps({"metrics": fast}))
+    argv = ["--suite", "clean", "--baseline", str(baseline), "--fail-on-regression", *small]
+    assert run.main(argv) == 1
+    assert "REGRESSED" in capsys.readouterr().out
+
+
+def test_loadgen_replays_jsonl_and_reports(tmp_path):
+    from benchmarks import loadgen
+
+    log = tmp_path / "requests.jsonl"
+    rows = [{"text": "hello there"}] * 3 + [{"text": "you are awful"}, {"text": "   "}, {}]
+    log.write_text("\n".join(json.dumps(r) for r in rows) + "\n")
+    assert loadgen.load_texts(log) == ["hello there"] * 3 + ["you are awful"]
+
+    out = tmp_path / "report.json"
+    assert loadgen.main(["--input", str(log), "--concurrency", "1", "--out", str(out)]) == 0
+    report = json.loads(out.read_text())
+    assert report["sent"] == 4
+    assert report["error_rate"] == 0.0
+    assert report["cache_hit_ratio"] == 0.5  # two repeats of "hello there"
+    assert set(report["latency_ms"]) == {"p50", "p90", "p99", "max"}
+
+    argv = ["--synthetic", "40", "--dup-ratio", "0.5", "--rate", "400", "--out", str(out)]
+    assert loadgen.main(argv) == 0
+    report = json.loads(out.read_text())
+    assert report["ok"] == report["sent"] > 0
+    assert report["cache_hit_ratio"] > 0
@@ -19,3 +19,91 @@ def test_cache_roundtrip(tmp_path, monkeypatch):
     assert got["score"] == val["score"]
     assert got["flagged"] == val["flagged"]
     assert got["labels"] == val["labels"]
+
+
+def test_buffered_writes_are_visible_and_flushed(tmp_path):
+    from moderation.cache import SQLiteCache
+
+    db_path = tmp_path / "mod_cache.db"
+    cache = SQLiteCache(db_path, flush_max_pending=1000, flush_interval_s=0)
+
+    rows = [(f"k{i}", i / 10, i % 2 == 0, {"toxic": i / 10}) for i in range(5)]
+    cache.put_many(rows)
+
+    # Visible before the flush
+    assert cache.get("k3") == {"score": 0.3, "flagged": False, "labels": {"toxic": 0.3}}
+    assert set(cache.get_many(["k0", "k4", "missing"])) == {"k0", "k4"}
+
+    # Nothing on disk yet; one transaction writes everything
+    assert SQLiteCache(db_path).get("k1") is None
+    assert cache.flush() == 5
+    cache.close()
+
+    reopened = SQLiteCache(db_path)
+    assert reopened.get_many([r[0] for r in rows]).keys() == {r[0] for r in rows}
+    assert reopened._conn().execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    reopened.close()
+
+
+def test_full_buffer_is_flushed_by_the_flusher_thread(tmp_path):
+    import threading
+    import time
+
+    from moderation.cache import SQLiteCache
+
+    cache = SQLiteCache(tmp_path / "mod_cache.db", flush_max_pending=3, flush_interval_s=60)
+    flushed_by = []
+    flush = cache.flush
+
+    def recording_flush():
+        flushed_by.append(threading.current_thread().name)
+        return flush()
+
+    cache.flush = recording_flush
+    cache.put_many((f"k{i}", 0.1, False, {"toxic": 0.1}) for i in range(3))
+    assert "MainThread" not in flushed_by
+
+    # The flusher is woken up instead of waiting for its 60 s tick
+    deadline = time.monotonic() + 5
+    while cache._pending and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not cache._pending
+    assert flushed_by == ["cache-flusher"]
+    cache.close()
+
+
+def test_memory_tier_lru_ttl_and_counters(tmp_path, monkeypatch):
+    from moderation import cache as mc
+
+    store = mc.SQLiteCache(tmp_path / "mod_cache.db", flush_interval_s=0)
+    tiered = mc.TieredCache(store, mc.MemoryCache(max_entries=2, ttl_s=60))
+
+    for k in ("a", "b", "c"):
+        tiered.put(k, 0.1, False, {"toxic": 0.1})
+    assert tiered.memory.stats()["evictions"] == 1  # "a" pushed out
+
+    # "b" is served from memory; "a" falls through to SQLite and is promoted
+    assert tiered.get("b")["score"] == 0.1
+    assert tiered.get("a")["labels"] == {"toxic": 0.1}
+    stats = tiered.stats()
+    assert stats["memory"]["hits"] == 1
+    assert stats["memory"]["misses"] == 1
+    assert stats["sqlite"]["hits"] == 1
+
+    # Expired entries are dropped and counted as misses
+    now = mc.time.monotonic()
+    monkeypatch.setattr(mc.time, "monotonic", lambda: now + 120)
+    assert tiered.memory.get("a") is None
+    assert tiered.memory.stats()["expirations"] == 1
+    store.close()
+
+
+def test_memory_tier_byte_budget():
+    from moderation.cache import MemoryCache
+
+    mem = MemoryCache(max_entries=1000, max_bytes=2000, ttl_s=60)
+    for i in range(50):
+        mem.put(f"k{i}", {"score": 0.0, "flagged": False, "labels": {"toxic": 0.0}})
+    stats = mem.stats()
+    assert 0 < stats["bytes"] <= 2000
+    assert stats["evictions"] == 50 - stats["entries"]
@@ -20,3 +20,28 @@ def test_basic_clean_removes_html_urls_and_normalizes():
     assert not re.search(r"\s{2,}", out)  # no double spaces
     assert not re.search(r"\s[!?.,;:]", out)  # no space before punctuation
     assert re.search(r"thanks[!?.,;:]?$", out)  # ends with 'thanks' (punct optional)
+
+
+def test_clean_series_matches_basic_clean():
+    import pandas as pd
+    from moderation.cleaning import clean_series
+
+    raw = pd.Series(
+        [
+            "Hello <b>WORLD</b>! Visit https://example.com now.\n\n Thanks!",
+            "check WWW.Test.com &amp; HTTP://CAPS.IO ,ok",
+            "  plain\ttext  , with   spaces ?  ",
+            "No markup here.",
+            "",
+            None,
+            float("nan"),
+            42,
+        ],
+        index=[10, 11, 12, 13, 14, 15, 16, 17],
+        name="text",
+    )
+    out = clean_series(raw)
+
+    assert out.index.equals(raw.index)
+    assert out.name == "text"
+    assert out.tolist() == [basic_clean(v) for v in raw.tolist()]
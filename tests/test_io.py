@@ -1,4 +1,6 @@
 # tests/test_io.py
+from datetime import timedelta
+
 import pandas as pd
 from moderation.io import (
     already_processed,
@@ -55,3 +57,131 @@ def test_read_and_write_roundtrip(tmp_path):
     # Assert
     assert list(df2.columns) == ["text"]
     assert len(df2) == 3
+
+
+def test_stage_frame_roundtrip_and_cleanup(tmp_path):
+    from moderation.io import clear_staging, load_staged, stage_frame
+
+    df = pd.DataFrame({"id": [1, 2], "clean_text": ["a", "b"]})
+    run_id = "manual__2024-01-01T00:00:00+00:00"
+
+    path = stage_frame(df, run_id, "clean", tmp_path)
+    assert path.endswith("clean.parquet")
+    pd.testing.assert_frame_equal(load_staged(path), df)
+
+    clear_staging(run_id, tmp_path)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_prune_staging_removes_only_old_runs(tmp_path):
+    import os
+    import time
+    from pathlib import Path
+
+    from moderation.io import prune_staging, stage_frame
+
+    df = pd.DataFrame({"clean_text": ["a"]})
+    old = Path(stage_frame(df, "failed_run", "clean", tmp_path)).parent
+    stage_frame(df, "recent_run", "clean", tmp_path)
+    week_ago = time.time() - 8 * 86400
+    os.utime(old, (week_ago, week_ago))
+
+    assert prune_staging(timedelta(days=7), tmp_path) == 1
+    assert [p.name for p in tmp_path.iterdir()] == ["recent_run"]
+    assert prune_staging(timedelta(days=7), tmp_path / "missing") == 0
+
+
+def test_bulk_state_store_and_retention(tmp_path, monkeypatch):
+    import moderation.io as io_mod
+    from moderation.state import ProcessedIndex
+
+    monkeypatch.setattr(io_mod, "STATE_FILE", tmp_path / "state" / ".processed_index.db")
+    monkeypatch.setattr(io_mod, "LEGACY_STATE_FILE", tmp_path / "state" / ".processed_index.json")
+
+    files = []
+    for i in range(5):
+        f = tmp_path / f"in_{i}.csv"
+        f.write_text(f"text\nrow {i}\n")
+        files.append(f)
+
+    assert io_mod.filter_unprocessed(files) == files
+    io_mod.mark_processed_many(files[:3])
+    assert io_mod.filter_unprocessed(files) == files[3:]
+
+    # Retention: entries older than the window are forgotten
+    index = ProcessedIndex(io_mod.STATE_FILE)
+    index.mark_many([("stale", "old.csv")], now=0.0)
+    assert "stale" in index
+    assert io_mod.prune_processed(timedelta(days=1)) == 1
+    assert "stale" not in index
+    assert len(index) == 3
+
+
+def test_legacy_json_state_is_migrated(tmp_path, monkeypatch):
+    import json
+
+    import moderation.io as io_mod
+
+    csv_path = tmp_path / "old.csv"
+    csv_path.write_text("text\nhello\n")
+    legacy = tmp_path / ".processed_index.json"
+    legacy.write_text(json.dumps([io_mod._file_hash(csv_path)]))
+
+    monkeypatch.setattr(io_mod, "STATE_FILE", tmp_path / ".processed_index.db")
+    monkeypatch.setattr(io_mod, "LEGACY_STATE_FILE", legacy)
+
+    assert already_processed(csv_path) is True
+    assert not legacy.exists()
+
+
+def test_content_fingerprint_skips_redelivered_duplicates(tmp_path, monkeypatch):
+    import os
+
+    import moderation.io as io_mod
+
+    monkeypatch.setattr(io_mod, "STATE_FILE", tmp_path / ".processed_index.db")
+    monkeypatch.setattr(io_mod, "FINGERPRINT_MODE", "content")
+
+    original = tmp_path / "batch_001.csv"
+    original.write_text("text\nsame rows\n")
+    mark_processed(original)
+
+    # Same bytes under a new name and mtime -> already processed
+    copy = tmp_path / "batch_001_resend.csv"
+    copy.write_text(original.read_text())
+    os.utime(copy, (1, 1))
+    assert already_processed(copy) is True
+
+    # Same size, different bytes -> must be processed
+    changed = tmp_path / "batch_002.csv"
+    changed.write_text("text\nsome rows\n")
+    assert already_processed(changed) is False
+
+
+def test_large_files_use_sample_precheck_without_false_skips(tmp_path, monkeypatch):
+    import moderation.io as io_mod
+
+    monkeypatch.setattr(io_mod, "STATE_FILE", tmp_path / ".processed_index.db")
+    monkeypatch.setattr(io_mod, "FINGERPRINT_MODE", "content")
+    monkeypatch.setattr(io_mod, "SAMPLE_MIN_BYTES", 1024)
+    monkeypatch.setattr(io_mod, "SAMPLE_BYTES", 16)
+
+    head, tail = b"h" * 100, b"t" * 100
+    done = tmp_path / "big.csv"
+    done.write_bytes(head + b"a" * 2000 + tail)
+    io_mod.mark_processed_many([done])
+
+    dup = tmp_path / "big_dup.csv"
+    dup.write_bytes(done.read_bytes())
+    # Same head/tail and size but a different middle: sample matches, full hash does not
+    edited = tmp_path / "big_edited.csv"
+    edited.write_bytes(head + b"b" * 2000 + tail)
+    unseen = tmp_path / "big_new.csv"
+    unseen.write_bytes(b"x" * 2200)
+
+    hashed = []
+    real_hash = io_mod._content_hash
+    monkeypatch.setattr(io_mod, "_content_hash", lambda p: hashed.append(p) or real_hash(p))
+
+    assert io_mod.filter_unprocessed([dup, edited, unseen]) == [edited, unseen]
+    assert unseen not in hashed  # sample mismatch alone proves it is new
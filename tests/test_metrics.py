@@ -0,0 +1,87 @@
+import threading
+
+import pytest
+from moderation.metrics import LatencyHistogram, Meter
+
+
+def test_histogram_percentiles_within_bucket_error():
+    h = LatencyHistogram()
+    for ms in range(1, 1001):  # 1..1000 ms
+        h.observe(ms)
+
+    assert h.count == 1000
+    assert h.max_ms == 1000
+    for q, exact in [(50, 500), (90, 900), (99, 990)]:
+        assert h.percentile(q) == pytest.approx(exact, rel=0.1)
+    assert h.percentile(100) == 1000
+    assert LatencyHistogram().summary()["p99"] == 0.0
+
+
+def test_meter_splits_series_and_is_thread_safe():
+    m = Meter()
+
+    def work():
+        for _ in range(1000):
+            m.inc(cache_hit=True, flagged=False, latency_ms=0.5)
+            m.inc(cache_hit=False, flagged=True, latency_ms=50.0)
+            m.observe_stage("inference", 40.0)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    snap = m.snapshot()
+    assert snap["requests_total"] == 8000
+    assert snap["cache_hits_total"] == 4000
+    assert snap["flagged_total"] == 4000
+    assert snap["latency_ms"]["all"]["count"] == 8000
+    assert snap["latency_ms"]["cache_hit"]["p99"] == pytest.approx(0.5, rel=0.1)
+    assert snap["latency_ms"]["model"]["p50"] == pytest.approx(50.0, rel=0.1)
+    assert snap["stage_latency_ms"]["inference"]["count"] == 4000
+    assert snap["stage_latency_ms"]["cache_write"]["count"] == 0
+
+
+def test_exposition_renders_labelled_histograms():
+    from moderation.metrics import Exposition
+
+    h = LatencyHistogram()
+    for ms in (0.3, 4.0, 4.0, 200.0):
+        h.observe(ms)
+
+    out = Exposition()
+    out.add("requests_total", "counter", "Requests.", 4)
+    out.add("queue_depth", "gauge", "Depth.", [({"pool": 'a"b'}, 2)])
+    out.latency_histogram("latency_seconds", "Latency.", [({"source": "model"}, h)])
+    out.add("process_resident_memory_bytes", "gauge", "RSS.", 1024)
+    lines = out.render().splitlines()
+
+    assert "# TYPE moderation_requests_total counter" in lines
+    assert "moderation_requests_total 4" in lines
+    assert 'moderation_queue_depth{pool="a\\"b"} 2' in lines
+    assert 'moderation_latency_seconds_bucket{source="model",le="0.0005"} 1' in lines
+    assert 'moderation_latency_seconds_bucket{source="model",le="0.005"} 3' in lines
+    assert 'moderation_latency_seconds_bucket{source="model",le="+Inf"} 4' in lines
+    assert 'moderation_latency_seconds_count{source="model"} 4' in lines
+    assert "process_resident_memory_bytes 1024" in lines
+
+
+def test_metrics_endpoint_serves_prometheus_text():
+    from fastapi.testclient import TestClient
+    from service.app import app
+
+    client = TestClient(app)
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain; version=0.0.4")
+    for name in (
+        "moderation_requests_total",
+        "moderation_inference_queue_depth",
+        "moderation_inference_batch_size_bucket",
+        "moderation_result_cache_lookups_total",
+        "process_resident_memory_bytes",
+    ):
+        assert name in r.text
+
+    assert "requests_total" in client.get("/metrics.json").json()
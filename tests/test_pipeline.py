@@ -25,3 +25,41 @@ def test_run_local_pipeline_end_to_end(tmp_path):
 
     # Validate toxicity_score range
     assert df["toxicity_score"].between(0, 1).all()
+
+
+def test_run_local_streaming_matches_in_memory_run(tmp_path):
+    import pyarrow.parquet as pq
+
+    raw = tmp_path / "raw.csv"
+    texts = [f"comment <b>{i}</b> see www.site{i}.com" for i in range(20)]
+    # The last chunk is all numeric and has non-numeric ids: both must still
+    # match the first chunk's schema
+    texts += [str(1000 + i) for i in range(5)]
+    ids = [str(i) for i in range(20)] + [f"x{i}" for i in range(20, 25)]
+    pd.DataFrame({"id": ids, "text": texts}).to_csv(raw, index=False)
+
+    seen = []
+    streamed = run_local(raw, tmp_path / "streamed.parquet", chunksize=10, progress=seen.append)
+    full = run_local(raw, tmp_path / "full.parquet")
+
+    assert [p.chunk_rows for p in seen] == [10, 10, 5]
+    assert seen[-1].rows_total == 25
+    assert pq.ParquetFile(streamed).metadata.num_row_groups == 3
+    pd.testing.assert_frame_equal(pd.read_parquet(streamed), pd.read_parquet(full))
+
+
+def test_parallel_clean_matches_serial_and_keeps_tidy_schema():
+    n = 50
+    df = pd.DataFrame(
+        {
+            "id": range(n),
+            "text": [f"Row {i} <b>BOLD</b> ,  see https://x.io/{i}" for i in range(n)],
+            "extra": [b"payload"] * n,
+        }
+    )
+    serial = clean(df, workers=1)
+    parallel = clean(df, workers=2, chunk_size=7)
+
+    assert list(parallel.columns) == ["id", "text", "clean_text"]
+    pd.testing.assert_frame_equal(parallel, serial)
+    assert parallel.loc[3, "clean_text"] == "row 3 bold, see"
@@ -0,0 +1,109 @@
+import json
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from moderation import policy as policy_mod
+from moderation.cache import SQLiteCache, TieredCache
+from moderation.policy import LABELS, Policy, load_policy, reapply_frame, reapply_parquet
+
+ROWS = [
+    {"toxic": 0.7, "severe_toxic": 0.0, "obscene": 0.1, "threat": 0.0, "insult": 0.2, "identity_hate": 0.0},
+    {"toxic": 0.1, "severe_toxic": 0.0, "obscene": 0.0, "threat": 0.35, "insult": 0.0, "identity_hate": 0.0},
+    {"toxic": 0.2, "severe_toxic": 0.0, "obscene": 0.0, "threat": 0.0, "insult": 0.55, "identity_hate": 0.0},
+]  # fmt: skip
+STRICT = Policy(default=0.5, thresholds={"threat": 0.3, "toxic": 0.8})
+
+
+def test_load_policy_from_env_and_file(tmp_path, monkeypatch):
+    monkeypatch.setenv("MOD_THRESHOLD", "0.6")
+    monkeypatch.setenv("MOD_THRESHOLDS", "threat:0.3, insult:0.7")
+    pol = load_policy()
+    assert pol.threshold("toxic") == 0.6
+    assert pol.threshold("threat") == 0.3
+    assert pol.threshold("insult") == 0.7
+
+    cfg = tmp_path / "policy.json"
+    cfg.write_text(json.dumps({"default": 0.4, "thresholds": {"obscene": 0.9}}))
+    pol = load_policy(cfg)
+    assert (pol.threshold("toxic"), pol.threshold("obscene")) == (0.4, 0.9)
+
+    with pytest.raises(ValueError, match="Unknown labels"):
+        Policy(thresholds={"spam": 0.5})
+
+
+def test_pipeline_threshold_follows_policy(monkeypatch):
+    from moderation import pipeline
+
+    monkeypatch.setattr(policy_mod, "_policy", Policy(default=0.7))
+    assert pipeline.THRESHOLD == 0.7
+    with pytest.raises(AttributeError):
+        pipeline.NOT_A_SETTING  # noqa: B018
+
+
+def test_vectorized_flags_match_per_row_decisions():
+    df = pd.DataFrame(ROWS)
+    assert Policy().flags(df).tolist() == [True, False, True]
+    assert STRICT.flags(df).tolist() == [False, True, True]
+    assert [STRICT.is_flagged(r) for r in ROWS] == [False, True, True]
+    assert STRICT.version != Policy().version
+
+
+def test_reapply_parquet_rewrites_flagged_only(tmp_path):
+    part = tmp_path / "dt=2024-01-01"
+    part.mkdir()
+    df = pd.DataFrame(ROWS).assign(id=[1, 2, 3], clean_text=["a", "b", "c"])
+    reapply_frame(df, Policy())
+    df.to_parquet(part / "scored.parquet", index=False)
+
+    totals = reapply_parquet([tmp_path], STRICT)
+    assert totals == {"files": 1, "rows": 3, "changed": 2}
+
+    out = pq.ParquetFile(part / "scored.parquet").read().to_pandas()
+    assert out["flagged"].tolist() == [False, True, True]
+    pd.testing.assert_frame_equal(out.drop(columns="flagged"), df.drop(columns="flagged"))
+
+
+def test_reapply_cache_updates_flags_in_sql(tmp_path, monkeypatch):
+    cache = TieredCache(SQLiteCache(tmp_path / "cache.db", flush_interval_s=0))
+    cache.put_many((f"h{i}", r["toxic"], Policy().is_flagged(r), r) for i, r in enumerate(ROWS))
+    monkeypatch.setattr(policy_mod, "_policy", STRICT)
+    monkeypatch.setattr("moderation.cache._cache", lambda: cache)
+
+    assert policy_mod.reapply_cache() == 2
+    got = cache.get_many([f"h{i}" for i in range(len(ROWS))])
+    assert [got[f"h{i}"]["flagged"] for i in range(len(ROWS))] == [False, True, True]
+    assert policy_mod.reapply_cache() == 0
+    cache.close()
+
+
+def test_api_applies_policy_to_cached_results(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+    from moderation import cache, pipeline
+    from service.app import app
+
+    class ToxicModel:
+        """Scores every text toxic 0.97, other labels 0.01."""
+
+        def __call__(self, texts, truncation=True, batch_size=1):
+            return [
+                [{"label": lab, "score": 0.97 if lab == "toxic" else 0.01} for lab in LABELS]
+                for _ in texts
+            ]
+
+    monkeypatch.setattr(pipeline, "_toxicity_model", ToxicModel())
+    monkeypatch.setattr(cache, "DB_PATH", tmp_path / "mod_cache.db")
+    monkeypatch.setattr(policy_mod, "_policy", Policy())
+
+    client = TestClient(app)
+    payload = {"text": "policy check: you are awful"}
+    first = client.post("/moderate", json=payload).json()
+    assert first["cached"] is False
+    assert first["flagged"] is True
+
+    lenient = Policy(default=1.01)
+    monkeypatch.setattr(policy_mod, "_policy", lenient)
+    again = client.post("/moderate", json=payload).json()
+    assert again["cached"] is True
+    assert again["flagged"] is False
+    assert set(again["labels"]) == set(LABELS)
@@ -0,0 +1,103 @@
+import pytest
+from benchmarks.stub_model import StubModel
+from moderation import pipeline, prefilter
+from moderation.metrics import meter
+from moderation.prefilter import BENIGN, EMPTY, MODEL, PreFilter
+
+BENIGN_TEXTS = [
+    "thanks for sharing",
+    "great post, very helpful",
+    "i agree with this",
+    "nice photo of the lake",
+    "see you at the meetup",
+    "good point about the budget",
+    "love this recipe",
+    "welcome to the forum",
+] * 5
+TOXIC_TEXTS = [
+    "you are a stupid idiot",
+    "shut up you moron",
+    "idiot idiot idiot",
+    "you stupid worthless loser",
+] * 5
+
+
+class RecordingModel(StubModel):
+    def __init__(self):
+        super().__init__(us_per_token=0)
+        self.seen: list[str] = []
+
+    def __call__(self, texts, **kwargs):
+        self.seen += list(texts)
+        return super().__call__(texts, **kwargs)
+
+
+@pytest.fixture
+def trained():
+    pf = PreFilter(benign_below=0.3).fit(
+        BENIGN_TEXTS + TOXIC_TEXTS, [False] * len(BENIGN_TEXTS) + [True] * len(TOXIC_TEXTS)
+    )
+    yield pf
+    prefilter.set_prefilter(None)
+
+
+@pytest.fixture
+def model(monkeypatch):
+    m = RecordingModel()
+    monkeypatch.setattr(pipeline, "_toxicity_model", m)
+    return m
+
+
+def test_route_splits_empty_benign_and_uncertain(trained):
+    routes, proba = trained.route(["", "   ", "thanks for sharing", "you stupid idiot"])
+    assert routes.tolist() == [EMPTY, EMPTY, BENIGN, MODEL]
+    assert proba[0] == 0.0 and proba[2] < 0.3 <= proba[3]
+
+
+def test_cascade_skips_model_for_benign_and_empty(trained, model):
+    prefilter.set_prefilter(trained)
+    before = dict(meter.counters)
+    texts = ["", "great post, very helpful", "you stupid idiot", "love this recipe"]
+
+    out = pipeline.score_multilabel(texts)
+
+    assert model.seen == ["you stupid idiot"]
+    assert out.attrs["routed_share"] == 0.25
+    assert out.loc[0, pipeline.MULTI_LABELS].sum() == 0.0
+    assert not out.loc[[0, 1, 3], "flagged"].any()
+    delta = {k: meter.counters[k] - before.get(k, 0) for k in meter.counters}
+    assert delta["prefilter_empty_total"] == 1
+    assert delta["prefilter_benign_total"] == 2
+    assert delta["prefilter_model_total"] == 1
+
+    # Cascade results get their own cache keys
+    key = pipeline.cache_key("love this recipe")
+    prefilter.set_prefilter(None)
+    assert pipeline.cache_key("love this recipe") != key
+
+
+def test_disabled_prefilter_scores_everything(model):
+    prefilter.set_prefilter(None)
+    out = pipeline.score_multilabel(["", "love this recipe"])
+    assert model.seen == ["", "love this recipe"]
+    assert out.attrs["routed_share"] == 1.0
+
+
+def test_save_load_round_trip(trained, tmp_path):
+    path = trained.save(tmp_path / "pf.joblib")
+    loaded = PreFilter.load(path)
+    assert loaded.version == trained.version
+    assert PreFilter.load(path, benign_below=0.01).version != trained.version
+
+
+def test_get_prefilter_keeps_trained_band_unless_overridden(trained, tmp_path, monkeypatch):
+    path = trained.save(tmp_path / "pf.joblib")
+    monkeypatch.setattr(prefilter, "ENABLED", True)
+    monkeypatch.setattr(prefilter, "MODEL_PATH", path)
+
+    monkeypatch.setattr(prefilter, "_loaded", False)
+    assert prefilter.get_prefilter().benign_below == 0.3
+
+    monkeypatch.setattr(prefilter, "BENIGN_BELOW_OVERRIDE", 0.01)
+    monkeypatch.setattr(prefilter, "_loaded", False)
+    assert prefilter.get_prefilter().benign_below == 0.01
@@ -1,4 +1,7 @@
+import pandas as pd
 import pytest
+from benchmarks.stub_model import StubModel
+from moderation import pipeline
 from moderation.pipeline import MULTI_LABELS, score_multilabel, score_toxicity
 
 
@@ -44,3 +47,164 @@ def test_each_label_probability_range(label):
     df = score_multilabel(["sample text"])
     assert label in df.columns
     assert df[label].between(0.0, 1.0, inclusive="both").all()
+
+
+def test_length_buckets_batch_by_size_and_restore_order(monkeypatch):
+    class WordTokenizer:
+        def __call__(self, texts, truncation=True, **_):
+            return {"input_ids": [t.split() for t in texts]}
+
+    class RecordingModel:
+        tokenizer = WordTokenizer()
+
+        def __init__(self):
+            self.calls = []
+
+        def __call__(self, texts, truncation=True, batch_size=1):
+            self.calls.append((list(texts), batch_size))
+            # "toxic" score encodes the word count so we can check ordering
+            return [[{"label": "toxic", "score": len(t.split()) / 100}] for t in texts]
+
+    model = RecordingModel()
+    monkeypatch.setattr(pipeline, "_toxicity_model", model)
+
+    texts = ["w " * 50, "w", "w " * 3, "w " * 9, "w w"]
+    df = score_multilabel(texts, buckets=[(2, 4), (8, 2), (512, 1)])
+
+    assert df["toxic"].tolist() == [0.5, 0.01, 0.03, 0.09, 0.02]
+    assert [(len(c), bs) for c, bs in model.calls] == [(2, 4), (1, 2), (2, 1)]
+    # Within the run, shorter texts go first
+    assert model.calls[0][0] == ["w", "w w"]
+
+
+def test_token_lengths_are_measured_in_bounded_slices(monkeypatch):
+    class WordTokenizer:
+        def __init__(self):
+            self.calls = []
+
+        def __call__(self, texts, truncation=True, **kwargs):
+            self.calls.append((len(texts), kwargs))
+            return {"input_ids": [t.split() for t in texts]}
+
+    class Model:
+        tokenizer = WordTokenizer()
+
+    monkeypatch.setattr(pipeline, "LENGTH_SLICE_ROWS", 2)
+    lengths = pipeline._token_lengths(Model(), ["a", "a b", "a b c", "", "a b c d"])
+    assert lengths.tolist() == [1, 2, 3, 0, 4]
+    assert [n for n, _ in Model.tokenizer.calls] == [2, 2, 1]
+    assert Model.tokenizer.calls[0][1] == {
+        "return_attention_mask": False,
+        "return_token_type_ids": False,
+    }
+
+
+class CountingModel(StubModel):
+    """Offline stand-in for toxic-bert that records every text it scores."""
+
+    def __init__(self):
+        super().__init__(us_per_token=0)
+        self.seen: list[str] = []
+
+    def __call__(self, texts, **kwargs):
+        self.seen += list(texts)
+        return super().__call__(texts, **kwargs)
+
+
+def test_dedup_scores_unique_texts_once_and_broadcasts(monkeypatch):
+    model = CountingModel()
+    monkeypatch.setattr(pipeline, "_toxicity_model", model)
+    texts = ["spam spam", "hello", "spam spam", "", "spam spam", ""]
+    df = pipeline.score_multilabel_dedup(texts)
+    assert sorted(model.seen) == ["", "hello", "spam spam"]
+    direct = score_multilabel(texts)
+
+    assert len(df) == len(texts)
+    assert df.attrs["dedup_ratio"] == pytest.approx(0.5)
+    pd.testing.assert_frame_equal(df, direct, check_exact=False, atol=1e-4)
+
+
+def test_cached_bulk_scoring_shares_results_across_calls(tmp_path, monkeypatch):
+    import moderation.cache as mc
+
+    monkeypatch.setattr(mc, "DB_PATH", tmp_path / "mod_cache.db")
+    model = CountingModel()
+    monkeypatch.setattr(pipeline, "_toxicity_model", model)
+    calls = []
+
+    def scorer(texts):
+        calls.append(list(texts))
+        return score_multilabel(texts)
+
+    texts = ["copy pasta", "unique one", "copy pasta"]
+    first = pipeline.score_multilabel_cached(texts, scorer=scorer)
+    assert calls == [["copy pasta", "unique one"]]
+    assert first.attrs["cache_hit_ratio"] == 0.0
+    # Written to SQLite before returning, not left in the write buffer
+    on_disk = mc.SQLiteCache(tmp_path / "mod_cache.db", flush_interval_s=0)
+    assert len(on_disk.get_many(pipeline.cache_key(t) for t in texts)) == 2
+    on_disk.close()
+
+    # Whitespace-normalized keys hit the cache, only the new text is scored
+    second = pipeline.score_multilabel_cached([" unique one ", "brand new"], scorer=scorer)
+    assert calls[-1] == ["brand new"]
+    assert len(calls) == 2
+    assert sorted(model.seen) == ["brand new", "copy pasta", "unique one"]
+    assert second.attrs["cache_hit_ratio"] == pytest.approx(0.5)
+    assert second.loc[0, "toxic"] == first.loc[1, "toxic"]
+    assert str(second["flagged"].dtype) == "bool"
+
+
+def test_long_docs_score_windows_batched_together(monkeypatch):
+    class WordTokenizer:  # no offsets: split_windows falls back to words
+        def __call__(self, texts, truncation=True, **_):
+            return {"input_ids": [t.split()[:12] if truncation else t.split() for t in texts]}
+
+    class TruncatingModel:
+        """Sees only the first 12 words, like a model with a short max length."""
+
+        tokenizer = WordTokenizer()
+
+        def __init__(self):
+            self.calls = []
+
+        def __call__(self, texts, truncation=True, batch_size=1):
+            self.calls.append(list(texts))
+            seen = [" ".join(t.split()[:12]) for t in texts]
+            return [[{"label": "toxic", "score": 0.9 if "stupid" in s else 0.1}] for s in seen]
+
+    model = TruncatingModel()
+    monkeypatch.setattr(pipeline, "_toxicity_model", model)
+    monkeypatch.setattr(pipeline, "WINDOW_TOKENS", 10)
+    monkeypatch.setattr(pipeline, "WINDOW_OVERLAP", 2)
+    monkeypatch.setattr(pipeline, "MAX_WINDOWS", 3)
+
+    words = [f"w{i}" for i in range(40)]
+    long_text = " ".join(words[:-1] + ["stupid"])
+    texts = [long_text, "short and fine"]
+
+    # Truncation misses the insult at the end
+    assert score_multilabel(texts)["toxic"].tolist() == [0.1, 0.1]
+
+    monkeypatch.setattr(pipeline, "LONG_DOCS", True)
+    windows, doc_ids = pipeline.split_windows(model, texts)
+    # 5 windows at stride 8 capped to 3: first, middle and last
+    assert [w.split()[0] for w in windows[:3]] == ["w0", "w16", "w30"]
+    assert windows[2].endswith("stupid") and windows[3] == "short and fine"
+    assert doc_ids.tolist() == [0, 0, 0, 1]
+
+    model.calls.clear()
+    df = score_multilabel(texts, buckets=[(512, 64)])
+    assert len(model.calls) == 1 and len(model.calls[0]) == 4
+    assert df["toxic"].tolist() == [0.9, 0.1]
+    assert df["flagged"].tolist() == [True, False]
+
+    monkeypatch.setattr(pipeline, "WINDOW_AGG", "mean")
+    assert score_multilabel(texts)["toxic"].tolist() == pytest.approx([(0.1 + 0.1 + 0.9) / 3, 0.1])
+
+
+def test_cache_key_separates_backends(monkeypatch):
+    monkeypatch.setattr(pipeline, "BACKEND", "torch")
+    torch_key = pipeline.cache_key("same text")
+    monkeypatch.setattr(pipeline, "BACKEND", "onnx-int8")
+    assert pipeline.cache_key("same text") != torch_key